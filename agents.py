@@ -1,9 +1,33 @@
 # agents.py
-from tools import general_math_solver, rag_solver, llm_fallback, log_thought
+from tools import general_math_solver, rag_solver, llm_fallback_async, llm_fallback_stream, log_thought
 from database import save_task_log, save_conversation, update_conversation_answer
-from config import SOLVER_CONF_THRESH
+from config import SOLVER_CONF_THRESH, SPECULATIVE_EXEC, SPECULATIVE_LLM
+from async_runtime import run_sync
+from concurrent.futures import ThreadPoolExecutor
+from thought_trace import current_trace
+from metrics import histogram, counter
+import contextvars
+import asyncio
+import time
 import json
 
+_speculation_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative-rag")
+
+_STAGE_SECONDS = histogram("mathwiz_stage_seconds", "Time spent in each SubjectAgent stage")
+_HANDLE_SECONDS = histogram("mathwiz_handle_seconds", "SubjectAgent.handle end to end, by agent and answering method")
+_FALLBACKS = counter("mathwiz_fallbacks_total", "Questions passed on to the next stage")
+
+
+def _timed(stage: str, fn, *args):
+    """Run fn(*args) (on a worker thread) and record its time under `stage`."""
+    with _STAGE_SECONDS.time(stage=stage):
+        return fn(*args)
+
+
+async def _atimed(stage: str, coro):
+    with _STAGE_SECONDS.time(stage=stage):
+        return await coro
+
 
 class SubjectAgent:
     """
@@ -16,6 +40,10 @@ class SubjectAgent:
         self.name = name
 
     def handle(self, question: str, convo_user: str = "anonymous") -> dict:
+        """Blocking wrapper around handle_async (runs on the shared event loop)."""
+        return run_sync(self.handle_async(question, convo_user=convo_user))
+
+    async def handle_async(self, question: str, convo_user: str = "anonymous") -> dict:
         """
         Handles a question end-to-end:
         1. Logs conversation
@@ -23,24 +51,121 @@ class SubjectAgent:
         3. RAG fallback if necessary
         4. LLM fallback if necessary
         5. Updates conversation & logs
-        Returns a dict with final answer, method, and confidence
+        Returns a dict with final answer, method, and confidence.
+        Solver and retrieval run on worker threads; the LLM call is awaited.
+        Stage and end-to-end times go to the metrics histograms.
         """
-        # ----------------------------------------------------
-        # 0) Start conversation
-        # ----------------------------------------------------
-        convo_id = save_conversation(convo_user, question, None, "in-progress")
-        final_answer = None
-        method_used = "unknown"
-        confidence_score = 0.0
+        t0 = time.perf_counter()
+        result = await self._handle_async(question, convo_user)
+        self._record(result, t0)
+        return result
+
+    async def _handle_async(self, question: str, convo_user: str) -> dict:
+        # The bookkeeping steps write to SQLite (opening the DB, reserving an
+        # id block under BEGIN IMMEDIATE), so they run off the event loop too
+        convo_id = await asyncio.to_thread(self._start, question, convo_user)
+        if SPECULATIVE_EXEC:
+            return await self._handle_speculative(convo_id, question)
 
+        log_thought("step_1_primary_solver", {"status": "attempting"})
+        primary = await asyncio.to_thread(_timed, "primary_solver", general_math_solver, question)
+        done = await asyncio.to_thread(self._after_primary, convo_id, primary)
+        if done:
+            return done
+
+        log_thought("step_2_rag_solver", {"status": "attempting"})
+        rag = await asyncio.to_thread(_timed, "rag_solver", rag_solver, question)
+        done = await asyncio.to_thread(self._after_rag, convo_id, rag)
+        if done:
+            return done
+
+        log_thought("step_3_llm_fallback", {"status": "attempting"})
+        llm_res = await _atimed("llm_fallback", llm_fallback_async(question))
+        return await asyncio.to_thread(self._after_llm, convo_id, llm_res)
+
+    async def _handle_speculative(self, convo_id: int, question: str) -> dict:
+        """
+        Start the solver and retrieval together (and the LLM call too with
+        SPECULATIVE_LLM), then settle them in the usual priority order with
+        the usual SOLVER_CONF_THRESH rule. Whatever is no longer needed is
+        cancelled: the LLM request is aborted, and thread work is discarded.
+        """
+        log_thought("step_1_primary_solver", {"status": "attempting", "speculative": True})
+        primary_task = asyncio.create_task(asyncio.to_thread(_timed, "primary_solver", general_math_solver, question))
+        rag_task = asyncio.create_task(asyncio.to_thread(_timed, "rag_solver", rag_solver, question))
+        llm_task = (asyncio.create_task(_atimed("llm_fallback", llm_fallback_async(question)))
+                    if SPECULATIVE_LLM else None)
+        try:
+            done = await asyncio.to_thread(self._after_primary, convo_id, await primary_task)
+            if done:
+                return done
+
+            log_thought("step_2_rag_solver", {"status": "attempting", "speculative": True})
+            done = await asyncio.to_thread(self._after_rag, convo_id, await rag_task)
+            if done:
+                return done
+
+            log_thought("step_3_llm_fallback", {"status": "attempting", "speculative": SPECULATIVE_LLM})
+            llm_res = await (llm_task if llm_task is not None else _atimed("llm_fallback", llm_fallback_async(question)))
+            return await asyncio.to_thread(self._after_llm, convo_id, llm_res)
+        finally:
+            for task in (rag_task, llm_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def handle_stream(self, question: str, convo_user: str = "anonymous"):
+        """
+        Same pipeline as handle, as a generator: yields LLM text pieces as
+        they arrive (nothing if the solver or RAG answers) and returns the
+        result dict. The full text is persisted once the stream ends.
+        """
+        t0 = time.perf_counter()
+        result = yield from self._handle_stream(question, convo_user)
+        self._record(result, t0)
+        return result
+
+    def _handle_stream(self, question: str, convo_user: str):
+        convo_id = self._start(question, convo_user)
+        # Speculative mode: retrieval runs while the solver works
+        rag_future = (_speculation_pool.submit(contextvars.copy_context().run, _timed, "rag_solver", rag_solver, question)
+                      if SPECULATIVE_EXEC else None)
+
+        log_thought("step_1_primary_solver", {"status": "attempting"})
+        done = self._after_primary(convo_id, _timed("primary_solver", general_math_solver, question))
+        if done:
+            if rag_future is not None:
+                rag_future.cancel()
+            return done
+
+        log_thought("step_2_rag_solver", {"status": "attempting"})
+        done = self._after_rag(convo_id, rag_future.result() if rag_future is not None
+                               else _timed("rag_solver", rag_solver, question))
+        if done:
+            return done
+
+        log_thought("step_3_llm_fallback", {"status": "attempting", "stream": True})
+        with _STAGE_SECONDS.time(stage="llm_fallback"):
+            llm_res = yield from llm_fallback_stream(question)
+        return self._after_llm(convo_id, llm_res)
+
+    def _record(self, result: dict, t0: float):
+        _HANDLE_SECONDS.observe(time.perf_counter() - t0, agent=self.name, method=result.get("method", "unknown"))
+
+    # ----------------------------------------------------
+    # 0) Start conversation
+    # ----------------------------------------------------
+    def _start(self, question: str, convo_user: str) -> int:
+        convo_id = save_conversation(convo_user, question, None, "in-progress")
+        current_trace().convo_id = convo_id
         log_thought("step_0_start", {"question": question, "user": convo_user})
         log_thought("step_0_classification", {"predicted_category": self.name})
+        return convo_id
 
-        # ----------------------------------------------------
-        # 1) PRIMARY SOLVER
-        # ----------------------------------------------------
-        log_thought("step_1_primary_solver", {"status": "attempting"})
-        primary = general_math_solver(question)
+    # ----------------------------------------------------
+    # 1) PRIMARY SOLVER
+    # ----------------------------------------------------
+    def _after_primary(self, convo_id: int, primary: dict):
+        """Log the solver attempt; return the final result if it is confident enough."""
         save_task_log(convo_id, self.name, "primary_solver", "attempt", primary.get("confidence", 0.0), meta=primary)
         log_thought("step_1_primary_solver_result", primary)
 
@@ -52,12 +177,14 @@ class SubjectAgent:
 
             log_thought("step_1_primary_solver_final", {"answer": final_answer, "method": method_used, "confidence": confidence_score})
             return {"answer": final_answer, "method": method_used, "confidence": confidence_score}
-
-        # ----------------------------------------------------
-        # 2) RAG FALLBACK
-        # ----------------------------------------------------
-        log_thought("step_2_rag_solver", {"status": "attempting"})
-        rag = rag_solver(question)
+        _FALLBACKS.inc(to="rag_solver")
+        return None
+
+    # ----------------------------------------------------
+    # 2) RAG FALLBACK
+    # ----------------------------------------------------
+    def _after_rag(self, convo_id: int, rag: dict):
+        """Log the retrieval attempt; return the final result if any chunks matched."""
         save_task_log(convo_id, self.name, "rag_solver", "attempt", 0.0, meta=rag)
 
         rag_chunks = rag.get("chunks", [])
@@ -71,12 +198,14 @@ class SubjectAgent:
 
             log_thought("step_2_rag_solver_final", {"answer": final_answer, "method": method_used, "confidence": confidence_score})
             return {"answer": final_answer, "method": method_used, "confidence": confidence_score}
-
-        # ----------------------------------------------------
-        # 3) LLM FALLBACK
-        # ----------------------------------------------------
-        log_thought("step_3_llm_fallback", {"status": "attempting"})
-        llm_res = llm_fallback(question)
+        _FALLBACKS.inc(to="llm_fallback")
+        return None
+
+    # ----------------------------------------------------
+    # 3) LLM FALLBACK
+    # ----------------------------------------------------
+    def _after_llm(self, convo_id: int, llm_res) -> dict:
+        """Log the LLM attempt and persist its answer as the final one."""
         save_task_log(convo_id, self.name, "llm_fallback", "attempt", 0.0, meta=llm_res)
         log_thought("step_3_llm_fallback_result", {"raw_llm": str(llm_res)[:200]})  # preview only
 
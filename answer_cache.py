@@ -0,0 +1,139 @@
+# answer_cache.py
+"""
+Question-level answer cache in front of main.answer_question.
+In-memory LRU backed by the answer_cache table. Keys are the normalized
+question plus its category; every entry carries a fingerprint of the RAG
+index and LLM configuration it was produced under, and is ignored (and
+dropped) once that fingerprint no longer matches.
+"""
+
+import threading
+from collections import OrderedDict
+
+from config import ANSWER_CACHE_SIZE
+from database import save_cached_answer, load_cached_answer
+from llm_clients import config_fingerprint
+from metrics import counter
+
+_LLM_FINGERPRINT = config_fingerprint()  # config is read once at import, so this is fixed per process
+
+
+def normalize_question(question: str) -> str:
+    """
+    Collapse whitespace only. Case and Unicode forms are kept: x and X are
+    different symbols, and NFKC would turn "x² = 4" into "x2 = 4".
+    """
+    return " ".join(question.split())
+
+
+def answer_key(question: str, category: str) -> str:
+    return f"{category.lower()}\x1f{normalize_question(question)}"
+
+
+def current_fingerprint() -> str:
+    from rag_engine import index_version  # numpy stays unloaded until a question comes in
+    return f"{_LLM_FINGERPRINT}|{index_version()}"
+
+
+def cacheable(result: dict) -> bool:
+    """Only cache real answers: not stub or failed LLM replies."""
+    answer = result.get("answer")
+    if answer is None or answer == "[LLM failed]":
+        return False
+    if isinstance(answer, dict):
+        return bool(answer.get("success")) and answer.get("model") != "stub"
+    return True
+
+
+class AnswerCache:
+    """
+    Thread-safe LRU of {key: (fingerprint, answer, method, confidence)}.
+    Memory misses fall through to the database; stores go to both
+    (the database write is queued through the write-behind thread).
+    """
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, persist: bool = True):
+        self.maxsize = maxsize
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counts = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0, "persistent_hits": 0}
+
+    def get(self, key: str, fingerprint: str):
+        """Return (answer, method, confidence) if a fresh entry exists, else None."""
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == fingerprint:
+                    self._entries.move_to_end(key)
+                    self._counts["hits"] += 1
+                    return entry[1:]
+                del self._entries[key]
+                self._counts["stale"] += 1
+        if self.persist:
+            row = load_cached_answer(key)
+            if row is not None and row["fingerprint"] == fingerprint:
+                entry = (fingerprint, row["answer"], row["method"], row["confidence"])
+                with self._lock:
+                    self._insert(key, entry)
+                    self._counts["hits"] += 1
+                    self._counts["persistent_hits"] += 1
+                return entry[1:]
+        with self._lock:
+            self._counts["misses"] += 1
+        return None
+
+    def put(self, key: str, fingerprint: str, answer, method: str, confidence: float):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._insert(key, (fingerprint, answer, method, confidence))
+        if self.persist:
+            save_cached_answer(key, fingerprint, answer, method, confidence)
+
+    def _insert(self, key: str, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._counts["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counts, "size": len(self._entries), "maxsize": self.maxsize}
+
+    def clear(self):
+        """Drop the in-memory entries and counters (persisted rows go stale on their own)."""
+        with self._lock:
+            self._entries.clear()
+            for k in self._counts:
+                self._counts[k] = 0
+
+
+_CACHE = AnswerCache()
+
+
+_LOOKUPS = counter("mathwiz_answer_cache_total", "Answer cache lookups")
+
+
+def lookup(question: str, category: str):
+    """(answer, method, confidence) for a repeat question, or None."""
+    hit = _CACHE.get(answer_key(question, category), current_fingerprint())
+    _LOOKUPS.inc(result="miss" if hit is None else "hit")
+    return hit
+
+
+def store(question: str, category: str, result: dict):
+    if cacheable(result):
+        _CACHE.put(answer_key(question, category), current_fingerprint(),
+                   result["answer"], result.get("method"), result.get("confidence", 0.0))
+
+
+def answer_cache_stats() -> dict:
+    return _CACHE.stats()
+
+
+def clear_answer_cache():
+    _CACHE.clear()
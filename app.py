@@ -1,6 +1,6 @@
 # app.py
 import streamlit as st
-from main import answer_question
+from main import answer_question_stream
 from tools import get_chain_of_thought  # Use getter instead of direct list
 import json
 
@@ -38,8 +38,18 @@ if st.button("Solve Question"):
     if not question.strip():
         st.error("Please enter a question.")
     else:
+        # Stream LLM tokens into a placeholder as they arrive
+        live = st.empty()
+        streamed = ""
+        res = {}
         with st.spinner("Thinking..."):
-            res = answer_question(question, user=user)
+            for event in answer_question_stream(question, user=user):
+                if event["event"] == "token":
+                    streamed += event["text"]
+                    live.markdown(streamed)
+                else:
+                    res = event
+        live.empty()
 
         # --- Nicely formatted answer ---
         st.markdown("### ✅ Answer")
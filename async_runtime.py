@@ -0,0 +1,44 @@
+# async_runtime.py
+"""
+One long-lived event loop on a daemon thread, shared by the sync wrappers
+(answer_question, SubjectAgent.handle). Keeping a single loop means the
+async HTTP clients and their keep-alive pools survive between calls, and
+many threads calling the sync API share one set of in-flight requests.
+"""
+
+import asyncio
+import threading
+
+_loop = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """The shared background loop, started on first use."""
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-runtime", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_sync(coro, timeout: float = None):
+    """
+    Run a coroutine on the shared loop and block for its result.
+    Must not be called from the loop's own thread (that would deadlock).
+    """
+    loop = get_loop()
+    if _running_loop() is loop:
+        coro.close()
+        raise RuntimeError("run_sync() called from inside the shared event loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
@@ -0,0 +1,186 @@
+# batch_solve.py
+"""
+Push a file of questions through main.answer_question.
+
+Input is JSONL or CSV, one question per record. The text is taken from the
+"question" field, else "body", else "title", so requests.jsonl works as-is.
+The record id comes from "id", else "request_id", else the line number.
+Questions fan out over a pool of worker processes. Each worker keeps its
+own DB connection, resident RAG index and answer cache warm between
+questions. Results are streamed to a JSONL file in input order, one line
+per question, flushed as it is written. Rerunning with the same output
+file skips the questions already answered, so an interrupted run resumes.
+
+Usage: python batch_solve.py questions.jsonl -o answers.jsonl [--workers 4] [--user batch] [--no-cache]
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from config import BATCH_WORKERS
+
+QUESTION_FIELDS = ("question", "body", "title")
+ID_FIELDS = ("id", "request_id")
+INFLIGHT_PER_WORKER = 4  # submitted ahead of the writer, per worker
+
+
+# -------------------------------------------------------------------
+# Input
+# -------------------------------------------------------------------
+def _record(index: int, raw: dict) -> dict:
+    question = next((raw[f] for f in QUESTION_FIELDS if raw.get(f)), None)
+    rid = next((raw[f] for f in ID_FIELDS if raw.get(f) not in (None, "")), index)
+    return {"index": index, "id": rid, "question": question, "user": raw.get("user")}
+
+
+def read_questions(path: str, fmt: str = None):
+    """Yield {"index", "id", "question", "user"} records from a JSONL or CSV file, lazily."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            for index, row in enumerate(csv.DictReader(f)):
+                yield _record(index, row)
+            return
+        index = 0
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                raw = json.loads(line)
+            except ValueError:
+                raw = {}
+            if isinstance(raw, str):
+                raw = {"question": raw}
+            yield _record(index, raw if isinstance(raw, dict) else {})
+            index += 1
+
+
+def completed_indexes(path: str) -> set:
+    """
+    Input positions already answered in an existing output file. A torn
+    last line (the run was killed mid-write) is cut off so appends stay valid.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    good = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["index"])
+            except (ValueError, KeyError, TypeError):
+                break
+            good += len(line)
+    if good < os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(good)
+    return done
+
+
+# -------------------------------------------------------------------
+# Worker side
+# -------------------------------------------------------------------
+def _init_worker():
+    """Load the pipeline, open the DB and map the RAG index once per worker process."""
+    import main  # noqa: F401
+    from database import open_db
+    from rag_engine import get_index
+    open_db()
+    get_index()
+
+
+def _answer(record: dict, user: str, use_cache: bool) -> dict:
+    from main import answer_question
+    out = {"index": record["index"], "id": record["id"], "question": record["question"]}
+    if not record["question"]:
+        return {**out, "method": "error", "error": "no question text in record"}
+    t0 = time.perf_counter()
+    try:
+        res = answer_question(record["question"], user=record["user"] or user, use_cache=use_cache)
+    except Exception as e:
+        res = {"method": "error", "error": str(e)}
+    return {**out, **res, "method": res.get("method") or "unknown",
+            "latency_ms": round((time.perf_counter() - t0) * 1000, 3)}
+
+
+# -------------------------------------------------------------------
+# Driver
+# -------------------------------------------------------------------
+def _ordered(pool, fn, items, window: int):
+    """Like pool.map, but keeps at most `window` tasks in flight so the input streams."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, *item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def run_batch(in_path: str, out_path: str, workers: int = None, user: str = "batch", use_cache: bool = True,
+              fmt: str = None, progress: int = 0) -> dict:
+    """
+    Answer every question in `in_path` that is not already in `out_path`.
+    Returns throughput and per-method counts for this run.
+    """
+    workers = workers or BATCH_WORKERS or os.cpu_count() or 1
+    done = completed_indexes(out_path)
+    todo = ((r, user, use_cache) for r in read_questions(in_path, fmt) if r["index"] not in done)
+    methods = Counter()
+    answered = 0
+    interrupted = False
+    t0 = time.perf_counter()
+    ctx = multiprocessing.get_context("spawn")  # same as the solver pool; fork and threads don't mix
+    with open(out_path, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker) as pool:
+        try:
+            for res in _ordered(pool, _answer, todo, workers * INFLIGHT_PER_WORKER):
+                out.write(json.dumps(res, default=str, ensure_ascii=False) + "\n")
+                out.flush()
+                methods[res["method"]] += 1
+                answered += 1
+                if progress and answered % progress == 0:
+                    rate = answered / (time.perf_counter() - t0)
+                    print(f"  {answered} answered, {rate:.1f} q/s", file=sys.stderr)
+        except KeyboardInterrupt:
+            interrupted = True
+            pool.shutdown(wait=False, cancel_futures=True)
+            print(f"interrupted after {answered} answers; rerun to resume", file=sys.stderr)
+    elapsed = time.perf_counter() - t0
+    return {
+        "answered": answered,
+        "skipped": len(done),
+        "workers": workers,
+        "elapsed_s": elapsed,
+        "questions_per_s": answered / elapsed if elapsed else 0.0,
+        "methods": dict(methods),
+        "interrupted": interrupted,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a JSONL/CSV file of questions with a process pool")
+    parser.add_argument("input", help="questions file (.jsonl or .csv)")
+    parser.add_argument("-o", "--output", help="JSONL results file (default: <input>.answers.jsonl)")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="input format (default: from the extension)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: BATCH_WORKERS or CPU count)")
+    parser.add_argument("--user", default="batch", help="user logged for records without a 'user' field")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the answer cache")
+    parser.add_argument("--progress", type=int, default=0, help="print a progress line every N answers")
+    args = parser.parse_args()
+    output = args.output or os.path.splitext(args.input)[0] + ".answers.jsonl"
+    stats = run_batch(args.input, output, workers=args.workers, user=args.user, use_cache=not args.no_cache,
+                      fmt=args.format, progress=args.progress)
+    print(f"{stats['answered']} answered ({stats['skipped']} already done) in {stats['elapsed_s']:.2f}s "
+          f"with {stats['workers']} workers: {stats['questions_per_s']:.2f} q/s", file=sys.stderr)
+    for method, n in sorted(stats["methods"].items(), key=lambda kv: -kv[1]):
+        print(f"  {method}: {n}", file=sys.stderr)
+    sys.exit(130 if stats["interrupted"] else 0)
@@ -0,0 +1,747 @@
+# benchmarks.py
+"""
+Offline benchmarks for the hot paths and the whole question pipeline.
+Everything runs locally: synthetic PDFs, a temporary database and index,
+and the stub LLM server in place of real providers.
+
+Usage: python benchmarks.py [name ...] [--json out.json] [--baseline base.json] [--save-baseline base.json]
+  (no names = run everything). With --baseline, timings and throughputs
+  that got worse by more than --tolerance (default BENCH_TOLERANCE) are
+  reported and the exit status is 1.
+"""
+
+import os
+import sys
+import time
+import json
+import atexit
+import random
+import shutil
+import hashlib
+import tempfile
+import argparse
+import platform
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Benchmarks log conversations and build indexes like the app does: keep them
+# out of the real database and data/ folders, and keep the LLM response cache
+# from hiding provider latency.
+_BENCH_DIR = tempfile.mkdtemp(prefix="mathwiz-bench-")
+atexit.register(shutil.rmtree, _BENCH_DIR, ignore_errors=True)  # registered first, so it runs last
+os.environ.setdefault("DB_PATH", os.path.join(_BENCH_DIR, "bench.db"))
+os.environ.setdefault("PDF_DIR", os.path.join(_BENCH_DIR, "pdfs"))
+os.environ.setdefault("VECTOR_DIR", os.path.join(_BENCH_DIR, "vector_store"))
+os.environ.setdefault("LLM_CACHE_DB", "")
+
+BENCHMARKS = {}
+
+# Cold-import budget for `from main import answer_question`; the startup benchmark fails above it
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", 1500))
+# Dependencies that must not be imported until a code path needs them
+LAZY_MODULES = ("crewai", "sympy", "numpy", "sklearn", "fitz", "httpx")
+
+# The example table shown in app.py
+APP_EXAMPLES = [
+    "Solve for x: 2x + 5 = 15", "Factorize x^2 + 5x + 6", "Simplify 3(x - 2) + 4x",
+    "Solve 3x/2 = 9", "If 2x - 3 = 7, what is x?",
+    "Derivative of x^2 + 3x", "∫(3x^2) dx", "Limit as x→0 of sin(x)/x", "d/dx (e^x)",
+    "Find f'(x) if f(x) = ln(x)",
+    "Mean of [2,4,6,8]", "Standard deviation of [1,2,3,4]", "Probability of heads in a fair coin",
+    "Median of [3,1,4,2,5]", "Variance of [2,4,4,4,5,5,7]",
+    "12 × 8", "√144", "15% of 200", "45 ÷ 5", "Solve 3 + 7 × 2",
+]
+
+ARITHMETIC_PROMPTS = [
+    "12 × 8", "45 ÷ 5", "3 + 7 × 2", "√144", "2^10", "(17 - 5) * 3 / 4",
+    "1/3 + 1/6", "0.1 + 0.2", "-3.5 * 2", "2^-3", "100 - 7 * (8 + 2)",
+]
+
+EQUATION_PROMPTS = [
+    "2*x + 5 = 15", "x**2 - 4 = 0", "3*x/2 = 9", "x**2 + 5*x + 6 = 0", "5*x - 7 = 3*x + 1",
+    "x**3 - x = 0", "factor(x**2 + 5*x + 6)", "expand((x + 1)**3)", "simplify(3*(x - 2) + 4*x)",
+]
+
+CALCULUS_PROMPTS = [
+    "diff(x**3 + 2*x, x)", "integrate(3*x**2, x)", "limit(sin(x)/x, x, 0)", "diff(exp(x), x)",
+    "integrate(sin(x), (x, 0, pi))", "Derivative of x^2 + 3x", "∫(3x^2) dx",
+]
+
+# Answered by the LLM fallback unless the index has something to say
+OPEN_QUESTIONS = [
+    "What is the integral of a Gaussian over the real line",
+    "Explain why the harmonic series diverges",
+    "How many primes are there below one hundred",
+    "What does a group homomorphism preserve",
+]
+
+# Index sizes (chunks) for the build and retrieval benchmark
+INDEX_SIZES = tuple(int(n) for n in os.getenv("BENCH_INDEX_SIZES", "100,1000,10000,100000").split(","))
+# Relative slowdown (or throughput loss) against the baseline reported as a regression
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", 0.25))
+
+
+def benchmark(name: str):
+    """Register a benchmark function under `name`."""
+    def wrap(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return wrap
+
+
+def _timeit(fn, repeat: int = 3) -> float:
+    """Best wall-clock time of `repeat` runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _latency(samples, prefix: str) -> dict:
+    """p50/p95/mean of `samples` (seconds) in milliseconds."""
+    return {
+        f"{prefix}_p50_ms": _percentile(samples, 0.50) * 1000,
+        f"{prefix}_p95_ms": _percentile(samples, 0.95) * 1000,
+        f"{prefix}_mean_ms": sum(samples) / len(samples) * 1000,
+    }
+
+
+def synthetic_chunks(n: int, words_per_chunk: int = 130, vocab_size: int = 5000, topics: int = 1, seed: int = 0):
+    """
+    Deterministic chunk-sized texts drawn from a random vocabulary.
+    With topics > 1 each chunk samples from one of `topics` slices of the
+    vocabulary, which gives the vectors some cluster structure.
+    """
+    rng = random.Random(seed)
+    vocab = ["".join(rng.choice("abcdefghijklmnop") for _ in range(rng.randint(2, 9))) for _ in range(vocab_size)]
+    per_topic = max(1, vocab_size // topics)
+    chunks = []
+    for _ in range(n):
+        t = rng.randrange(topics)
+        words = vocab[t * per_topic:(t + 1) * per_topic]
+        chunks.append(" ".join(rng.choice(words) for _ in range(words_per_chunk)))
+    return chunks
+
+
+def write_synthetic_pdfs(folder: str, n_chunks: int, pages_per_pdf: int = 500, seed: int = 0) -> int:
+    """
+    Write PDFs into `folder` holding about `n_chunks` chunks of text in total.
+    64 distinct pages of random words are drawn once and then repeated, so
+    large corpora are quick to produce. Returns the number of pages written.
+    """
+    import fitz
+    from config import CHUNK_SIZE, CHUNK_OVERLAP
+
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    vocab = ["".join(rng.choice("abcdefghijklmnop") for _ in range(rng.randint(2, 9))) for _ in range(5000)]
+    template = fitz.open()
+    page_chars = 0
+    for _ in range(64):
+        lines = [" ".join(rng.choice(vocab) for _ in range(18)) for _ in range(80)]
+        template.new_page().insert_text((20, 20), lines, fontsize=5)
+        page_chars += sum(len(line) + 1 for line in lines)
+    page_chars /= 64
+    pages = max(1, round(n_chunks * (CHUNK_SIZE - CHUNK_OVERLAP) / page_chars))
+    written = 0
+    while written < pages:
+        doc = fitz.open()
+        while doc.page_count < min(pages_per_pdf, pages - written):
+            doc.insert_pdf(template, to_page=min(63, pages - written - doc.page_count - 1))
+        doc.save(os.path.join(folder, f"synthetic{written // pages_per_pdf:05d}.pdf"))
+        written += doc.page_count
+        doc.close()
+    template.close()
+    return pages
+
+
+_bench_index_state = (None, 0)  # (requested size, chunks indexed)
+
+
+def _bench_index(n_chunks: int) -> dict:
+    """
+    Make the (temporary) index hold about `n_chunks` synthetic chunks, 0 for
+    an empty index. PDFs are written once per size; the index is rebuilt
+    only when the size changes ("build_s" is only present then).
+    """
+    global _bench_index_state
+    import rag_engine
+    from config import PDF_DIR
+
+    folder = os.path.join(PDF_DIR, f"synthetic-{n_chunks}")
+    if not os.path.isdir(folder):
+        if n_chunks:
+            write_synthetic_pdfs(folder, n_chunks)
+        else:
+            os.makedirs(folder)
+    if _bench_index_state[0] == n_chunks:
+        return {"chunks": _bench_index_state[1]}
+    t0 = time.perf_counter()
+    chunks = rag_engine.build_index_from_folder(folder, incremental=False)
+    _bench_index_state = (n_chunks, chunks)
+    return {"chunks": chunks, "build_s": time.perf_counter() - t0}
+
+
+# -------------------------------------------------------------------
+# Solver
+# -------------------------------------------------------------------
+@benchmark("solver")
+def bench_solver(repeat: int = 3) -> dict:
+    """
+    solve_math_expression per prompt, uncached and cached, on arithmetic,
+    equation and calculus prompts and the app.py example table.
+    """
+    import calculator
+
+    corpora = {"arithmetic": ARITHMETIC_PROMPTS, "equation": EQUATION_PROMPTS,
+               "calculus": CALCULUS_PROMPTS, "app": APP_EXAMPLES}
+
+    def attempt(q, use_cache):
+        try:
+            calculator.solve_math_expression(q, use_cache=use_cache)
+            return True
+        except Exception:
+            return False
+
+    attempt("x + 1 = 2", False)  # start the solver pool and import SymPy there
+    results = {}
+    for name, prompts in corpora.items():
+        cold = []
+        solved = 0
+        for i in range(repeat):
+            for q in prompts:
+                t0 = time.perf_counter()
+                ok = attempt(q, False)
+                cold.append(time.perf_counter() - t0)
+                solved += ok and i == 0
+        calculator.clear_solver_cache()
+        for q in prompts:
+            attempt(q, True)
+        warm = []
+        for q in prompts * repeat:
+            t0 = time.perf_counter()
+            attempt(q, True)
+            warm.append(time.perf_counter() - t0)
+        results[f"{name}_prompts"] = len(prompts)
+        results[f"{name}_solved"] = solved
+        results.update(_latency(cold, name))
+        results[f"{name}_cached_p50_us"] = _percentile(warm, 0.50) * 1e6
+    return results
+
+
+# -------------------------------------------------------------------
+# Embedding
+# -------------------------------------------------------------------
+@benchmark("embedding")
+def bench_embedding(n_chunks: int = 2000) -> dict:
+    """Per-chunk MD5 loop (the original local_hash_embedding) vs batched embed_texts."""
+    import numpy as np
+    import rag_engine
+    from config import EMBED_DIM
+
+    def legacy(text, dim=EMBED_DIM):
+        vec = np.zeros(dim, dtype=float)
+        for i, w in enumerate(text.lower().split()):
+            h = int(hashlib.md5(w.encode("utf-8")).hexdigest()[:8], 16)
+            vec[i % dim] += (h % 1000) / 1000.0
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        return vec
+
+    chunks = synthetic_chunks(n_chunks)
+    ref = np.vstack([legacy(c) for c in chunks]).astype("float32")
+    t_legacy = _timeit(lambda: np.vstack([legacy(c) for c in chunks]).astype("float32"))
+
+    rag_engine._VOCAB.clear()
+    t0 = time.perf_counter()
+    out = rag_engine.embed_texts(chunks, mode="compat")
+    t_cold = time.perf_counter() - t0
+    t_warm = _timeit(lambda: rag_engine.embed_texts(chunks, mode="compat"))
+
+    return {
+        "chunks": n_chunks,
+        "identical": bool(np.array_equal(ref, out)),
+        "legacy_chunks_per_s": n_chunks / t_legacy,
+        "batch_cold_chunks_per_s": n_chunks / t_cold,
+        "batch_warm_chunks_per_s": n_chunks / t_warm,
+        "speedup_warm": t_legacy / t_warm,
+    }
+
+
+# -------------------------------------------------------------------
+# Numeric fast path
+# -------------------------------------------------------------------
+@benchmark("numeric")
+def bench_numeric(repeat: int = 200) -> dict:
+    """Numeric fast path vs the eval/SymPy path, per prompt, on arithmetic and the app examples."""
+    import calculator
+
+    prompts = ARITHMETIC_PROMPTS + [q for q in APP_EXAMPLES if q not in ARITHMETIC_PROMPTS]
+    fast_hits = [q for q in prompts if calculator.numeric_fast_path(q) is not None]
+
+    def slow_path(q):
+        try:
+            calculator._solve(q)
+        except Exception:
+            pass
+
+    t_fast = _timeit(lambda: [calculator.numeric_fast_path(q) for q in fast_hits for _ in range(repeat)])
+    t_slow = _timeit(lambda: [slow_path(q) for q in fast_hits for _ in range(repeat)], repeat=1)
+    n = len(fast_hits) * repeat
+    results = {
+        "prompts": len(prompts),
+        "fast_path_prompts": len(fast_hits),
+        "fast_us": t_fast / n * 1e6,
+        "eval_sympy_us": t_slow / n * 1e6,
+        "speedup_vs_eval": t_slow / t_fast,
+    }
+    if calculator.SOLVER_POOL_SIZE > 0:
+        # What an uncached arithmetic question cost before: a round trip to a sandboxed worker
+        pool = calculator._get_pool()
+        pool.solve("1+1")
+        t_pool = _timeit(lambda: [pool.solve(q) for q in fast_hits for _ in range(20)], repeat=1)
+        results["sandboxed_us"] = t_pool / (len(fast_hits) * 20) * 1e6
+        results["speedup_vs_sandboxed"] = results["sandboxed_us"] / results["fast_us"]
+    return results
+
+
+# -------------------------------------------------------------------
+# Vector search
+# -------------------------------------------------------------------
+@benchmark("search")
+def bench_search(n_vectors: int = 50000, n_queries: int = 200, top_k: int = 4) -> dict:
+    """
+    Recall@k and per-query latency of each search backend against the old
+    cosine + argsort path, for both embedding modes.
+    """
+    import numpy as np
+    import rag_engine
+
+    chunks = synthetic_chunks(n_vectors, topics=64, seed=1)
+    # Queries: the first half of freshly drawn chunks, so each has a real neighbourhood
+    picks = [" ".join(q.split()[:65]) for q in synthetic_chunks(n_queries, topics=64, seed=2)]
+    results = {"vectors": n_vectors, "k": top_k}
+
+    for mode in ("compat", "hashed"):
+        vectors = rag_engine.embed_texts(chunks, mode=mode)
+        queries = rag_engine.embed_texts(picks, mode=mode)
+
+        def baseline(q):
+            norms = np.linalg.norm(vectors, axis=1)
+            norms[norms == 0] = 1.0
+            sims = (vectors @ q) / norms / (np.linalg.norm(q) or 1.0)
+            return np.argsort(-sims)[:top_k]
+
+        truth = [set(baseline(q).tolist()) for q in queries]
+        t_base = _timeit(lambda: [baseline(q) for q in queries], repeat=1) / n_queries
+        results[f"{mode}_baseline_ms"] = t_base * 1000
+
+        def measure(label, searcher):
+            found = [searcher.search(q, top_k)[0] for q in queries]
+            recall = np.mean([len(truth[i] & set(f.tolist())) / top_k for i, f in enumerate(found)])
+            t = _timeit(lambda: [searcher.search(q, top_k) for q in queries], repeat=1) / n_queries
+            results[f"{mode}_{label}_recall"] = float(recall)
+            results[f"{mode}_{label}_ms"] = t * 1000
+
+        measure("exact", rag_engine.ExactSearch(vectors))
+        t0 = time.perf_counter()
+        ivf = rag_engine.IVFSearch(vectors)
+        results[f"{mode}_ivf_build_s"] = time.perf_counter() - t0
+        for nprobe in (1, 4, 8, 16, 32):
+            ivf.nprobe = nprobe
+            measure(f"ivf_nprobe{nprobe}", ivf)
+    return results
+
+
+@benchmark("index")
+def bench_index(sizes=INDEX_SIZES, n_queries: int = 200) -> dict:
+    """
+    build_index_from_folder on synthetic PDFs of each size (extraction,
+    chunking, embedding and merge), local_hash_embedding per chunk, and
+    retrieve() latency against each index.
+    """
+    import rag_engine
+
+    sample = synthetic_chunks(1000, seed=3)
+    t = _timeit(lambda: [rag_engine.local_hash_embedding(c) for c in sample])
+    results = {"local_hash_embedding_us": t / len(sample) * 1e6}
+    queries = [" ".join(q.split()[:12]) for q in synthetic_chunks(n_queries, seed=4)]
+    for n in sizes:
+        built = _bench_index(n)
+        chunks = built["chunks"]
+        results[f"n{n}_chunks"] = chunks
+        if "build_s" in built:
+            results[f"n{n}_build_s"] = built["build_s"]
+            results[f"n{n}_build_chunks_per_s"] = chunks / built["build_s"]
+        rag_engine.retrieve(queries[0])  # map the new index
+        samples = []
+        for q in queries:
+            t0 = time.perf_counter()
+            rag_engine.retrieve(q)
+            samples.append(time.perf_counter() - t0)
+        results.update(_latency(samples, f"n{n}_retrieve"))
+        t = _timeit(lambda: rag_engine.retrieve_many(queries), repeat=1)
+        results[f"n{n}_retrieve_many_ms"] = t / n_queries * 1000
+    return results
+
+
+# -------------------------------------------------------------------
+# Storage
+# -------------------------------------------------------------------
+@benchmark("db_write")
+def bench_db_write(n: int = 3000, threads: int = 4) -> dict:
+    """
+    Conversation logging as one question does it (insert, task log, answer
+    update), from one thread and from several, until flushed to disk.
+    """
+    import database
+    from config import DB_WRITE_BEHIND
+
+    def question(i):
+        convo_id = database.save_conversation("bench", f"question {i}", None, "in-progress")
+        database.save_task_log(convo_id, "bench", "primary_solver", "attempt", 0.95, meta={"i": i, "result": "42"})
+        database.update_conversation_answer(convo_id, "42", "primary_solver")
+
+    database.open_db()
+    results = {"write_behind": DB_WRITE_BEHIND, "questions": n}
+    t0 = time.perf_counter()
+    for i in range(n):
+        question(i)
+    database.flush_writes()
+    t = time.perf_counter() - t0
+    results["serial_rows_per_s"] = 3 * n / t
+    results["serial_us_per_question"] = t / n * 1e6
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(question, range(n)))
+    database.flush_writes()
+    t = time.perf_counter() - t0
+    results[f"threads{threads}_rows_per_s"] = 3 * n / t
+    return results
+
+
+# -------------------------------------------------------------------
+# LLM HTTP client
+# -------------------------------------------------------------------
+@benchmark("llm_http")
+def bench_llm_http(n_requests: int = 200) -> dict:
+    """Pooled keep-alive session vs a bare requests.post per call, against the local stub server."""
+    import requests
+    import llm_clients
+    from llm_stub_server import StubLLMServer
+
+    body = {"model": "bench", "messages": [{"role": "user", "content": "1+1"}]}
+    with StubLLMServer() as srv:
+        url = f"{srv.base_url}/chat/completions"
+        t_bare = _timeit(lambda: [requests.post(url, json=body, timeout=5).json() for _ in range(n_requests)], repeat=1)
+        bare_connections = srv.counts["connections"]
+        t_pooled = _timeit(lambda: [llm_clients.call_openrouter("1+1", base_url=srv.base_url, api_key="bench")
+                                    for _ in range(n_requests)], repeat=1)
+        pooled_connections = srv.counts["connections"] - bare_connections
+    return {
+        "requests": n_requests,
+        "bare_ms": t_bare / n_requests * 1000,
+        "pooled_ms": t_pooled / n_requests * 1000,
+        "bare_connections": bare_connections,
+        "pooled_connections": pooled_connections,
+    }
+
+
+def _percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+@benchmark("llm_hedge")
+def bench_llm_hedge(n_requests: int = 40, hedge_delay: float = 0.15) -> dict:
+    """
+    Sequential vs hedged generate() against two fake providers. The primary
+    answers in 50 ms except every 4th request, which takes 1 s.
+    """
+    import llm_clients
+    from llm_stub_server import StubLLMServer
+
+    def provider(name, srv):
+        return (name, lambda p, cancel=None: llm_clients.call_openrouter(
+            p, base_url=srv.base_url, api_key="bench", cancel=cancel))
+
+    results = {"requests": n_requests, "hedge_delay_s": hedge_delay}
+    for mode in ("sequential", "hedged"):
+        with StubLLMServer(delay=0.05, slow_every=4, slow_delay=1.0, name="primary") as primary, \
+                StubLLMServer(delay=0.05, name="backup") as backup:
+            providers = [provider("primary", primary), provider("backup", backup)]
+            samples, winners = [], {}
+            for i in range(n_requests):
+                t0 = time.perf_counter()
+                if mode == "hedged":
+                    res = llm_clients._hedged(f"q{i}", providers, hedge_delay)
+                else:
+                    res = llm_clients._sequential(f"q{i}", providers)
+                samples.append(time.perf_counter() - t0)
+                winners[res["provider"]] = winners.get(res["provider"], 0) + 1
+        results[f"{mode}_p50_ms"] = _percentile(samples, 0.50) * 1000
+        results[f"{mode}_p95_ms"] = _percentile(samples, 0.95) * 1000
+        results[f"{mode}_winners"] = winners
+    return results
+
+
+@benchmark("llm_stream")
+def bench_llm_stream(n_requests: int = 10) -> dict:
+    """Time-to-first-token of generate_stream vs the full-completion latency of generate."""
+    import llm_clients
+    from llm_stub_server import StubLLMServer
+
+    reply = " ".join(["token"] * 40)
+    with StubLLMServer(delay=0.1, token_delay=0.01, reply=reply) as srv:
+        old = llm_clients.OPENROUTER_API_KEY, llm_clients.OPENROUTER_BASE
+        llm_clients.OPENROUTER_API_KEY, llm_clients.OPENROUTER_BASE = "bench", srv.base_url
+        try:
+            full, ttft, streamed = [], [], []
+            for i in range(n_requests):
+                t0 = time.perf_counter()
+                llm_clients.generate(f"q{i}")
+                full.append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                first = None
+                for _ in llm_clients.generate_stream(f"q{i}"):
+                    first = first or time.perf_counter() - t0
+                ttft.append(first)
+                streamed.append(time.perf_counter() - t0)
+        finally:
+            llm_clients.OPENROUTER_API_KEY, llm_clients.OPENROUTER_BASE = old
+    return {
+        "requests": n_requests,
+        "full_completion_p50_ms": _percentile(full, 0.5) * 1000,
+        "stream_ttft_p50_ms": _percentile(ttft, 0.5) * 1000,
+        "stream_total_p50_ms": _percentile(streamed, 0.5) * 1000,
+    }
+
+
+@benchmark("pipeline")
+def bench_pipeline(rounds: int = 3, llm_delay: float = 0.3) -> dict:
+    """
+    p50/p95 of SubjectAgent.handle per question: sequential vs speculative
+    (solver + RAG in parallel) vs speculative with the LLM call warmed too.
+    The LLM is the local stub server with a fixed delay; RAG searches a
+    synthetic 1000-chunk index.
+    """
+    import agents
+    import calculator
+    import llm_clients
+    from llm_stub_server import StubLLMServer
+
+    questions = APP_EXAMPLES + [
+        "What is the integral of a Gaussian over the real line",
+        "Explain why the harmonic series diverges",
+        "How many primes are there below one hundred",
+    ]
+    agent = agents.SubjectAgent("bench")
+    _bench_index(1000)
+    results = {"questions": len(questions), "rounds": rounds, "llm_delay_s": llm_delay}
+    with StubLLMServer(delay=llm_delay) as srv:
+        old = llm_clients.OPENROUTER_API_KEY, llm_clients.OPENROUTER_BASE
+        llm_clients.OPENROUTER_API_KEY, llm_clients.OPENROUTER_BASE = "bench", srv.base_url
+        saved = agents.SPECULATIVE_EXEC, agents.SPECULATIVE_LLM
+        try:
+            agent.handle("1+1")  # warm the solver pool, index and HTTP session
+            for label, spec, spec_llm in (("sequential", False, False), ("speculative", True, False),
+                                          ("speculative_llm", True, True)):
+                agents.SPECULATIVE_EXEC, agents.SPECULATIVE_LLM = spec, spec_llm
+                samples, methods = [], {}
+                for _ in range(rounds):
+                    calculator.clear_solver_cache()
+                    for q in questions:
+                        t0 = time.perf_counter()
+                        res = agent.handle(q)
+                        samples.append(time.perf_counter() - t0)
+                        methods[res["method"]] = methods.get(res["method"], 0) + 1
+                results[f"{label}_p50_ms"] = _percentile(samples, 0.50) * 1000
+                results[f"{label}_p95_ms"] = _percentile(samples, 0.95) * 1000
+                results[f"{label}_methods"] = methods
+            results["llm_requests"] = srv.counts["requests"]
+        finally:
+            agents.SPECULATIVE_EXEC, agents.SPECULATIVE_LLM = saved
+            llm_clients.OPENROUTER_API_KEY, llm_clients.OPENROUTER_BASE = old
+    return results
+
+
+@benchmark("answer_question")
+def bench_answer_question(rounds: int = 2, llm_delay: float = 0.05, threads: int = 8, index_chunks: int = 1000) -> dict:
+    """
+    Full main.answer_question (classification, agent, logging; answer cache
+    off) against the stub LLM server. Runs once with a synthetic index of
+    `index_chunks` chunks (solver or RAG answers) and once with an empty
+    index (LLM fallback), sequentially and from `threads` threads.
+    """
+    import llm_clients
+    import main
+    from llm_stub_server import StubLLMServer
+
+    questions = APP_EXAMPLES + EQUATION_PROMPTS + OPEN_QUESTIONS
+    results = {"questions": len(questions), "rounds": rounds, "llm_delay_s": llm_delay}
+    with StubLLMServer(delay=llm_delay) as srv:
+        old = llm_clients.OPENROUTER_API_KEY, llm_clients.OPENROUTER_BASE, llm_clients.MISTRAL_API_KEY
+        llm_clients.OPENROUTER_API_KEY, llm_clients.OPENROUTER_BASE, llm_clients.MISTRAL_API_KEY = "bench", srv.base_url, ""
+        try:
+            for label, n_chunks in (("rag", index_chunks), ("llm", 0)):
+                _bench_index(n_chunks)
+                main.answer_question("1+1", use_cache=False)  # warm the solver pool, index and HTTP clients
+                samples, methods = [], {}
+                for _ in range(rounds):
+                    for q in questions:
+                        t0 = time.perf_counter()
+                        res = main.answer_question(q, user="bench", use_cache=False)
+                        samples.append(time.perf_counter() - t0)
+                        methods[res["method"]] = methods.get(res["method"], 0) + 1
+                results.update(_latency(samples, label))
+                results[f"{label}_methods"] = methods
+                t0 = time.perf_counter()
+                with ThreadPoolExecutor(threads) as pool:
+                    list(pool.map(lambda q: main.answer_question(q, user="bench", use_cache=False), questions * rounds))
+                results[f"{label}_threads{threads}_questions_per_s"] = len(questions) * rounds / (time.perf_counter() - t0)
+            results["llm_requests"] = srv.counts["requests"]
+        finally:
+            llm_clients.OPENROUTER_API_KEY, llm_clients.OPENROUTER_BASE, llm_clients.MISTRAL_API_KEY = old
+    return results
+
+
+@benchmark("metrics")
+def bench_metrics(n: int = 200000) -> dict:
+    """Cost of one histogram observe / counter inc / timer, i.e. the instrumentation overhead per stage."""
+    from metrics import Histogram, Counter
+    hist, ctr = Histogram("bench_seconds"), Counter("bench_total")
+    t0 = time.perf_counter()
+    for i in range(n):
+        hist.observe(0.003, stage="bench")
+    observe = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(n):
+        ctr.inc(result="hit")
+    inc = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(n):
+        with hist.time(stage="bench"):
+            pass
+    timer = time.perf_counter() - t0
+    return {"observe_ns": observe / n * 1e9, "inc_ns": inc / n * 1e9, "timer_ns": timer / n * 1e9}
+
+
+@benchmark("startup")
+def bench_startup(runs: int = 5) -> dict:
+    """
+    Cold import of the question pipeline in a fresh interpreter, best of
+    `runs`, against STARTUP_BUDGET_MS. Also lists which LAZY_MODULES the
+    import dragged in; any of them counts as a failure.
+    """
+    probe = (
+        "import sys, time, json\n"
+        "t0 = time.perf_counter()\n"
+        "from main import answer_question\n"
+        "dt = time.perf_counter() - t0\n"
+        f"print(json.dumps([dt, [m for m in {LAZY_MODULES!r} if m in sys.modules]]))\n"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    best, loaded = float("inf"), []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", probe], cwd=here, capture_output=True, text=True, check=True)
+        dt, loaded = json.loads(out.stdout.strip().splitlines()[-1])
+        best = min(best, dt)
+    return {
+        "import_ms": best * 1000,
+        "budget_ms": STARTUP_BUDGET_MS,
+        "eager_modules": ",".join(loaded) or "-",
+        "passed": best * 1000 <= STARTUP_BUDGET_MS and not loaded,
+    }
+
+
+# -------------------------------------------------------------------
+# Results and regression check
+# -------------------------------------------------------------------
+def _direction(key: str) -> int:
+    """+1 if bigger is better, -1 if smaller is better, 0 if the value is not a performance figure."""
+    if key.endswith("_per_s") or "speedup" in key or key.endswith("_recall"):
+        return 1
+    if key.endswith(("_ms", "_us", "_ns", "_s")):
+        return -1
+    return 0
+
+
+def compare(results: dict, baseline: dict, tolerance: float = BENCH_TOLERANCE) -> list:
+    """
+    Figures that got worse than the baseline by more than `tolerance`
+    (relative), as {"benchmark", "metric", "baseline", "current", "change"}.
+    Only benchmarks and metrics present in both runs are compared.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for key, value in metrics.items():
+            base = baseline.get(name, {}).get(key)
+            sign = _direction(key)
+            if not sign or isinstance(value, bool) or not isinstance(value, (int, float)) \
+                    or not isinstance(base, (int, float)) or not base:
+                continue
+            change = (value - base) / abs(base)
+            if change * sign < -tolerance:
+                regressions.append({"benchmark": name, "metric": key, "baseline": base,
+                                    "current": value, "change": change})
+    return regressions
+
+
+def _environment() -> dict:
+    from config import EMBED_MODE, RAG_BACKEND, SOLVER_POOL_SIZE, DB_WRITE_BEHIND
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "commit": commit,
+        "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+        "config": {"EMBED_MODE": EMBED_MODE, "RAG_BACKEND": RAG_BACKEND,
+                   "SOLVER_POOL_SIZE": SOLVER_POOL_SIZE, "DB_WRITE_BEHIND": DB_WRITE_BEHIND},
+    }
+
+
+def run(names=None) -> dict:
+    results = {}
+    for name in names or list(BENCHMARKS):
+        if name not in BENCHMARKS:
+            raise SystemExit(f"unknown benchmark {name!r}; choose from {', '.join(BENCHMARKS)}")
+        results[name] = BENCHMARKS[name]()
+        print(f"== {name}")
+        for k, v in results[name].items():
+            print(f"  {k}: {v:.4g}" if isinstance(v, float) else f"  {k}: {v}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline MathWiz benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--json", help="write environment and results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON from an earlier --json/--save-baseline run to compare against")
+    parser.add_argument("--save-baseline", help="write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE, help="relative change allowed before a regression")
+    args = parser.parse_args()
+
+    report = {"environment": _environment(), "results": run(args.names)}
+    ok = all(r.get("passed", True) for r in report["results"].values())
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["baseline"] = {"file": args.baseline, "environment": baseline.get("environment")}
+        report["regressions"] = compare(report["results"], baseline.get("results", {}), args.tolerance)
+        print(f"== regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+        for reg in report["regressions"]:
+            print(f"  {reg['benchmark']}.{reg['metric']}: {reg['baseline']:.4g} -> {reg['current']:.4g} "
+                  f"({reg['change']:+.0%})")
+        if not report["regressions"]:
+            print("  none")
+        ok = ok and not report["regressions"]
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, default=str)
+    sys.exit(0 if ok else 1)
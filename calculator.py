@@ -2,35 +2,482 @@
 """
 Math expression solver used by the primary solver.
 Attempts symbolic solve (SymPy), then numeric evaluation as fallback.
+Results are memoized in a bounded LRU/TTL cache keyed on the cleaned
+expression, optionally backed by SQLite so they survive restarts.
+Uncached solves run in a pool of worker processes with a wall-clock
+timeout and an RSS cap, so one pathological input cannot stall the app.
+Plain arithmetic never gets that far: it is parsed, validated and
+evaluated exactly (Fractions) by a small in-process numeric fast path.
 """
 
+import os
 import re
+import ast
+import importlib.util
+import math
+import operator
+import time
+import atexit
+import sqlite3
+import threading
+import multiprocessing
+from fractions import Fraction
+from functools import lru_cache
+from collections import OrderedDict
+from config import NUMERIC_CACHE_SIZE, NUMERIC_MAX_DIGITS
+from config import SOLVER_CACHE_SIZE, SOLVER_CACHE_TTL, SOLVER_CACHE_DB
+from config import SOLVER_POOL_SIZE, SOLVER_TIMEOUT, SOLVER_MAX_RSS_MB
+from metrics import histogram, counter
 
-# Try to import SymPy if available (recommended)
-try:
-    import sympy as sp
-    SYMPY_AVAILABLE = True
-except:
-    SYMPY_AVAILABLE = False
+# SymPy (recommended) is slow to import, so it is only loaded by the first
+# solve that needs it, normally inside a solver worker process
+SYMPY_AVAILABLE = importlib.util.find_spec("sympy") is not None
+
+def _sympy():
+    import sympy
+    return sympy
+
+
+_OPERATOR_ALIASES = str.maketrans({"×": "*", "÷": "/", "−": "-"})
+_DISALLOWED = re.compile(r"[^0-9a-zA-Z+\-*/().=^ ]+")
 
 
 def clean_expression(expr: str) -> str:
     """
     Removes unwanted characters to protect evaluation.
-    Only digits, letters, math operators allowed.
+    Only digits, letters, math operators allowed (×, ÷ and − are mapped
+    to their ASCII operators first).
+    """
+    return _DISALLOWED.sub("", expr.translate(_OPERATOR_ALIASES))
+
+
+# -------------------------------------------------------------
+# NUMERIC FAST PATH
+# -------------------------------------------------------------
+_NUMERIC_CHARS = re.compile(r"[0-9+\-*/(). ]+")
+_MAX_BITS = NUMERIC_MAX_DIGITS * math.log2(10)
+
+
+class _NotFast(Exception):
+    """The expression needs the general solver (non-integer power, 1/0, ...)."""
+
+
+def _pow(base: Fraction, exp: Fraction) -> Fraction:
+    if exp.denominator != 1:
+        raise _NotFast()
+    if abs(base) not in (0, 1):
+        size = max(math.log2(abs(base.numerator)), math.log2(base.denominator))
+        if abs(exp.numerator) * size > _MAX_BITS:
+            raise NumericLimitExceeded(f"Result would exceed {NUMERIC_MAX_DIGITS} digits")
+    return base ** exp.numerator
+
+
+_BINOPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Pow: _pow,
+}
+_UNARYOPS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+
+def _build(node, source: str):
+    """Turn a validated AST node into a zero-argument closure returning a Fraction."""
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        # Parse the literal text so 0.1 is exactly 1/10, not the nearest float
+        value = Fraction(ast.get_source_segment(source, node))
+        return lambda: value
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+        op, left, right = _BINOPS[type(node.op)], _build(node.left, source), _build(node.right, source)
+        return lambda: op(left(), right())
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARYOPS:
+        op, operand = _UNARYOPS[type(node.op)], _build(node.operand, source)
+        return lambda: op(operand())
+    raise _NotFast()
+
+
+@lru_cache(maxsize=NUMERIC_CACHE_SIZE)
+def _compile_numeric(expr: str):
+    """Compiled evaluator for a pure-arithmetic expression, or None."""
+    if not _NUMERIC_CHARS.fullmatch(expr):
+        return None
+    try:
+        return _build(ast.parse(expr.strip(), mode="eval").body, expr.strip())
+    except (SyntaxError, _NotFast):
+        return None
+
+
+def _format_number(value: Fraction) -> str:
+    """Integers as integers, terminating fractions as exact decimals, anything else as p/q."""
+    num, den = value.numerator, value.denominator
+    if max(num.bit_length(), den.bit_length()) > _MAX_BITS:
+        raise NumericLimitExceeded(f"Result would exceed {NUMERIC_MAX_DIGITS} digits")
+    if den == 1:
+        return str(num)
+    twos = fives = 0
+    d = den
+    while d % 2 == 0:
+        d //= 2
+        twos += 1
+    while d % 5 == 0:
+        d //= 5
+        fives += 1
+    if d != 1:
+        return f"{num}/{den}"
+    places = max(twos, fives)
+    digits = str(abs(num) * 10 ** places // den).rjust(places + 1, "0")
+    text = (digits[:-places] + "." + digits[-places:]).rstrip("0")
+    return ("-" if num < 0 else "") + text
+
+
+def numeric_fast_path(question: str):
+    """
+    Evaluate purely numeric questions ("45 ÷ 5", "3 + 7 × 2") without
+    SymPy or eval. Returns the answer string, or None if the question
+    needs the general solver. Raises NumericLimitExceeded for results too
+    large to represent (e.g. 9^9^9).
+    """
+    expr = " ".join(clean_expression(question).replace("^", "**").split())
+    if not expr:
+        return None
+    compiled = _compile_numeric(expr)
+    if compiled is None:
+        return None
+    try:
+        return _format_number(compiled())
+    except (_NotFast, ZeroDivisionError):
+        return None
+
+
+# -------------------------------------------------------------
+# RESULT CACHE
+# -------------------------------------------------------------
+class SolverCache:
+    """
+    Bounded LRU cache of solver outcomes with a TTL, plus an optional
+    SQLite tier (db_path) that survives restarts. Thread-safe.
+    Outcomes are (ok, value): the answer string, or the error message.
+    """
+
+    def __init__(self, maxsize: int = SOLVER_CACHE_SIZE, ttl: float = SOLVER_CACHE_TTL, db_path: str = SOLVER_CACHE_DB):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored_at, ok, value)
+        self._counts = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "persistent_hits": 0}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("""CREATE TABLE IF NOT EXISTS solver_cache (
+                key TEXT PRIMARY KEY,
+                ok INTEGER,
+                value TEXT,
+                stored_at REAL
+            )""")
+            if ttl > 0:
+                self._db.execute("DELETE FROM solver_cache WHERE stored_at < ?", (time.time() - ttl,))
+            self._db.commit()
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl > 0 and now - stored_at > self.ttl
+
+    def get(self, key: str):
+        """Return (ok, value) for a cached outcome, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._entries.move_to_end(key)
+                    self._counts["hits"] += 1
+                    return entry[1], entry[2]
+                del self._entries[key]
+                self._counts["expirations"] += 1
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT ok, value, stored_at FROM solver_cache WHERE key=?", (key,)
+                ).fetchone()
+                if row and not self._expired(row[2], now):
+                    self._insert(key, (row[2], bool(row[0]), row[1]))
+                    self._counts["hits"] += 1
+                    self._counts["persistent_hits"] += 1
+                    return bool(row[0]), row[1]
+            self._counts["misses"] += 1
+            return None
+
+    def put(self, key: str, ok: bool, value: str):
+        now = time.time()
+        with self._lock:
+            self._insert(key, (now, ok, value))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO solver_cache (key, ok, value, stored_at) VALUES (?, ?, ?, ?)",
+                    (key, int(ok), value, now)
+                )
+                self._db.commit()
+
+    def _insert(self, key: str, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._counts["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counts, "size": len(self._entries), "maxsize": self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for k in self._counts:
+                self._counts[k] = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM solver_cache")
+                self._db.commit()
+
+
+_CACHE = SolverCache()
+
+
+def solver_cache_stats() -> dict:
+    """Hit/miss/eviction counters of the solver result cache."""
+    return _CACHE.stats()
+
+
+def clear_solver_cache():
+    _CACHE.clear()
+
+
+def cache_key(question: str) -> str:
+    """Normalized cache key: the cleaned expression with whitespace collapsed."""
+    return " ".join(clean_expression(question).split())
+
+
+# -------------------------------------------------------------
+# SANDBOXED WORKER POOL
+# -------------------------------------------------------------
+class SolverLimitExceeded(Exception):
+    """A solve hit the time or memory limit; the worker was killed."""
+
+
+class NumericLimitExceeded(SolverLimitExceeded):
+    """The numeric fast path refused a result that would be too large."""
+
+
+class SolverUnavailable(SolverLimitExceeded):
+    """No worker could take the question (pool closed, worker failed to start); says nothing about the question."""
+
+
+def _worker_main(conn):
+    """Worker process loop: solve questions received on conn until it closes."""
+    while True:
+        try:
+            question = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send((True, _solve(question)))
+        except MemoryError:
+            conn.send((None, "Solver exceeded memory limit"))  # None: a limit, not an answer
+        except Exception as e:
+            conn.send((False, str(e)))
+
+
+def _rss_mb(pid: int):
+    """Resident set size of a process in MB (Linux /proc), or None if unknown."""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child,), daemon=True)
+        self.proc.start()
+        child.close()
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.join()
+        self.conn.close()
+
+
+class SolverPool:
+    """
+    Pool of worker processes running _solve. Each question gets `timeout`
+    seconds of wall-clock time and `max_rss_mb` of resident memory; a worker
+    that exceeds either is killed and replaced, and the caller gets
+    SolverLimitExceeded. Waiting for a free worker also counts against
+    `timeout`.
     """
-    allowed = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ+-*/().=^ "
-    return "".join([c for c in expr if c in allowed])
 
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, size: int = SOLVER_POOL_SIZE, timeout: float = SOLVER_TIMEOUT, max_rss_mb: float = SOLVER_MAX_RSS_MB):
+        self.size = size
+        self.timeout = timeout
+        self.max_rss_mb = max_rss_mb
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = []  # LIFO: the most recently used worker is the warmest
+        self._cond = threading.Condition()  # notified whenever a worker is returned or a slot frees up
+        self._started = 0
+        self._closed = False
+
+    def _acquire(self) -> _Worker:
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise SolverUnavailable("solver pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._started < self.size:
+                    self._started += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SolverLimitExceeded(f"No solver worker free within {self.timeout:g}s")
+                self._cond.wait(remaining)
+        try:
+            return _Worker(self._ctx)
+        except Exception as e:
+            self._free_slot()
+            raise SolverUnavailable(f"Could not start a solver worker: {e}") from e
 
-def solve_math_expression(question: str) -> str:
+    def _release(self, worker: _Worker):
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify()
+
+    def _free_slot(self):
+        with self._cond:
+            self._started -= 1
+            self._cond.notify()
+
+    def _discard(self, worker: _Worker):
+        worker.kill()
+        self._free_slot()  # wakes a waiter, which starts a replacement
+
+    def solve(self, question: str) -> str:
+        worker = self._acquire()
+        try:
+            worker.conn.send(question)
+            deadline = time.monotonic() + self.timeout
+            while not worker.conn.poll(self.POLL_INTERVAL):
+                if time.monotonic() >= deadline:
+                    raise SolverLimitExceeded(f"Solver timed out after {self.timeout:g}s")
+                rss = _rss_mb(worker.proc.pid)
+                if self.max_rss_mb and rss is not None and rss > self.max_rss_mb:
+                    raise SolverLimitExceeded(f"Solver exceeded memory limit ({self.max_rss_mb:g} MB)")
+            ok, value = worker.conn.recv()
+        except SolverLimitExceeded:
+            self._discard(worker)
+            raise
+        except (EOFError, OSError):
+            self._discard(worker)
+            raise SolverUnavailable("Solver worker died")
+        rss = _rss_mb(worker.proc.pid)
+        if self.max_rss_mb and rss is not None and rss > self.max_rss_mb:
+            # Finished, but left too big to keep around
+            self._discard(worker)
+        elif ok is None:
+            self._discard(worker)  # hit MemoryError: don't reuse a worker that may be in a bad state
+        else:
+            self._release(worker)
+        if ok is None:
+            raise SolverLimitExceeded(value)
+        if not ok:
+            raise Exception(value)
+        return value
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for worker in idle:
+            worker.kill()
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool():
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = SolverPool()
+                atexit.register(_POOL.close)
+    return _POOL
+
+
+_SOLVER_SECONDS = histogram("mathwiz_solver_seconds", "Solver time by path: numeric fast path or SymPy")
+_SOLVER_CACHE = counter("mathwiz_solver_cache_total", "Solver result cache lookups")
+
+
+def _solve_limited(question: str) -> str:
+    """
+    Try the numeric fast path, then run _solve in the sandboxed pool
+    (or in-process if SOLVER_POOL_SIZE is 0).
+    """
+    t0 = time.perf_counter()
+    result = numeric_fast_path(question)
+    if result is not None:
+        _SOLVER_SECONDS.observe(time.perf_counter() - t0, path="numeric")
+        return result
+    with _SOLVER_SECONDS.time(path="sympy"):
+        if SOLVER_POOL_SIZE <= 0:
+            try:
+                return _solve(question)
+            except MemoryError:
+                raise SolverLimitExceeded("Solver exceeded memory limit")
+        return _get_pool().solve(question)
+
+
+def solve_math_expression(question: str, use_cache: bool = True) -> str:
     """
     Solves the math question.
     - If it's an equation: solve symbolically
     - If it's an expression: evaluate it
-    Returns the final answer as a string.
+    Returns the final answer as a string. Outcomes (answers and failures)
+    are memoized; pass use_cache=False to always recompute.
+    Raises SolverLimitExceeded if the solve hits the time or memory limit,
+    or SolverUnavailable (a subclass) if the pool can't run it; neither is cached.
     """
+    if not use_cache or _CACHE.maxsize <= 0:
+        return _solve_limited(question)
+
+    key = cache_key(question)
+    cached = _CACHE.get(key)
+    _SOLVER_CACHE.inc(result="miss" if cached is None else "hit")
+    if cached is not None:
+        ok, value = cached
+        if ok:
+            return value
+        raise Exception(value)
+
+    try:
+        result = _solve_limited(question)
+    except SolverLimitExceeded:
+        # Limits and pool failures depend on load and settings, not the
+        # question; don't pin them in the cache
+        raise
+    except Exception as e:
+        _CACHE.put(key, False, str(e))
+        raise
+    _CACHE.put(key, True, result)
+    return result
+
 
+def _solve(question: str) -> str:
     expr = clean_expression(question)
 
     # -------------------------------------------------------------
@@ -40,6 +487,7 @@ def solve_math_expression(question: str) -> str:
         if not SYMPY_AVAILABLE:
             raise Exception("SymPy not installed → unable to solve symbolic equations")
 
+        sp = _sympy()
         left, right = expr.split("=")
         left = sp.sympify(left)
         right = sp.sympify(right)
@@ -67,7 +515,7 @@ def solve_math_expression(question: str) -> str:
     # -------------------------------------------------------------
     if SYMPY_AVAILABLE:
         try:
-            result = sp.simplify(expr)
+            result = _sympy().simplify(expr)
             return str(result)
         except:
             pass
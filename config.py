@@ -6,19 +6,55 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 
 DATA_DIR = os.path.join(BASE_DIR, "data")
-PDF_DIR = os.path.join(DATA_DIR, "pdfs")
-VECTOR_DIR = os.path.join(DATA_DIR, "vector_store")
-DB_PATH = os.path.join(DATA_DIR, "math_agent.db")
+PDF_DIR = os.getenv("PDF_DIR", os.path.join(DATA_DIR, "pdfs"))
+VECTOR_DIR = os.getenv("VECTOR_DIR", os.path.join(DATA_DIR, "vector_store"))
+DB_PATH = os.getenv("DB_PATH", os.path.join(DATA_DIR, "math_agent.db"))
 
-os.makedirs(PDF_DIR, exist_ok=True)
-os.makedirs(VECTOR_DIR, exist_ok=True)
-os.makedirs(DATA_DIR, exist_ok=True)
+def ensure_dirs():
+    """Create the data directories. Called by whatever writes there, not at import."""
+    for path in (DATA_DIR, PDF_DIR, VECTOR_DIR):
+        os.makedirs(path, exist_ok=True)
 
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 800))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 200))
 EMBED_DIM = int(os.getenv("EMBED_DIM", 128))
+EMBED_MODE = os.getenv("EMBED_MODE", "compat")  # "compat" (position buckets) or "hashed"
+EMBED_VOCAB_SIZE = int(os.getenv("EMBED_VOCAB_SIZE", 200000))
+EMBED_BATCH = int(os.getenv("EMBED_BATCH", 256))  # chunks embedded and written per batch during builds
 TOP_K = int(os.getenv("TOP_K", 4))
+RAG_BACKEND = os.getenv("RAG_BACKEND", "exact")  # "exact", "ivf" or "auto"
+IVF_MIN_VECTORS = int(os.getenv("IVF_MIN_VECTORS", 50000))  # "auto" switches to IVF at this size
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 8))  # lists scanned per query: higher = better recall, slower
+RETRIEVE_BLOCK_MB = int(os.getenv("RETRIEVE_BLOCK_MB", 64))  # score-matrix budget for batch retrieval
 SOLVER_CONF_THRESH = float(os.getenv("SOLVER_CONF_THRESH", 0.75))
+SPECULATIVE_EXEC = os.getenv("SPECULATIVE_EXEC", "0") not in ("0", "false", "False", "")  # solver and RAG in parallel
+SPECULATIVE_LLM = os.getenv("SPECULATIVE_LLM", "0") not in ("0", "false", "False", "")  # also start the LLM call (may spend tokens)
+SOLVER_CACHE_SIZE = int(os.getenv("SOLVER_CACHE_SIZE", 4096))  # 0 disables the solver result cache
+SOLVER_CACHE_TTL = float(os.getenv("SOLVER_CACHE_TTL", 86400))  # seconds, 0 = never expire
+SOLVER_CACHE_DB = os.getenv("SOLVER_CACHE_DB", "")  # SQLite file for a persistent tier ("" = memory only)
+NUMERIC_CACHE_SIZE = int(os.getenv("NUMERIC_CACHE_SIZE", 4096))  # compiled arithmetic expressions kept
+NUMERIC_MAX_DIGITS = int(os.getenv("NUMERIC_MAX_DIGITS", 4000))  # fast path refuses larger powers
+SOLVER_POOL_SIZE = int(os.getenv("SOLVER_POOL_SIZE", 2))  # sandboxed solver processes, 0 = solve in-process
+SOLVER_TIMEOUT = float(os.getenv("SOLVER_TIMEOUT", 5.0))  # seconds per question
+SOLVER_MAX_RSS_MB = float(os.getenv("SOLVER_MAX_RSS_MB", 512))  # per worker, 0 = no memory cap
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", 1))  # index build processes; 0 = one per CPU core
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 0))  # batch_solve.py processes, 0 = one per CPU core
+TRACE_CAPACITY = int(os.getenv("TRACE_CAPACITY", 64))  # chain-of-thought steps kept per question
+TRACE_MAX_PAYLOAD = int(os.getenv("TRACE_MAX_PAYLOAD", 2000))  # characters per step when exported
+ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", 256))  # questions in flight per process
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 2048))  # answered questions kept in memory, 0 disables
+
+# In-process latency histograms and counters (see metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "False", "")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # serve /metrics and /metrics.json here, 0 = no endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# SQLite logging: write-behind batching (off = commit every write inline)
+DB_WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "1") not in ("0", "false", "False", "")
+DB_MAX_LAG_MS = int(os.getenv("DB_MAX_LAG_MS", 200))  # longest a queued write waits before commit
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", 256))  # writes per transaction
+DB_ID_BLOCK = int(os.getenv("DB_ID_BLOCK", 64))  # row ids reserved per table at a time
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", 4))  # read-only connections for queries
 
 # LLM provider keys (optional)
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
@@ -27,3 +63,18 @@ HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY", "")
 MISTRAL_BASE = os.getenv("MISTRAL_BASE", "")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "gpt-4o-mini")
+
+# LLM HTTP clients: one keep-alive session pool per provider, retries on 429/5xx
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 30))  # seconds per attempt
+LLM_POOL_CONNECTIONS = int(os.getenv("LLM_POOL_CONNECTIONS", 4))  # hosts cached per provider session
+LLM_POOL_MAXSIZE = int(os.getenv("LLM_POOL_MAXSIZE", 16))  # keep-alive connections per host
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))  # extra attempts after the first
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))  # seconds, doubled per retry, jittered
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 8.0))  # longest wait; a longer Retry-After gives up
+LLM_ASYNC_MAX_CONNECTIONS = int(os.getenv("LLM_ASYNC_MAX_CONNECTIONS", 256))  # per provider, async client
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", os.path.join(DATA_DIR, "llm_cache.db"))  # "" disables the response cache
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 7 * 86400))  # seconds, 0 = never expire
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 50000))  # least recently used evicted past this
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") not in ("0", "false", "False", "")  # race providers instead of waiting
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", 2.0))  # seconds before the backup provider fires, 0 = at once
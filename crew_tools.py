@@ -0,0 +1,27 @@
+# crew_tools.py
+"""
+CrewAI @tool wrappers around the internal tools. Kept out of tools.py so
+the question pipeline never has to import crewai; only crew_setup (or
+anything else that builds a Crew) pulls this module in.
+"""
+from crewai.tools import tool
+from tools import general_math_solver, rag_solver, llm_fallback
+import json
+
+@tool("General Math Solver Tool")
+def general_math_solver_tool(question: str) -> str:
+    """CrewAI tool: solves a general math question and returns JSON string."""
+    res = general_math_solver(question)
+    return json.dumps(res)
+
+@tool("RAG PDF Math Solver")
+def rag_tool_query(question: str, top_k: int = 4) -> str:
+    """CrewAI tool: retrieves relevant PDF chunks for the question."""
+    res = rag_solver(question, top_k=top_k)
+    return json.dumps(res)
+
+@tool("LLM Fallback Reasoner")
+def llm_fallback_tool(question: str) -> str:
+    """CrewAI tool: generates an answer using LLM fallback."""
+    res = llm_fallback(question)
+    return json.dumps(res)
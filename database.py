@@ -1,10 +1,53 @@
 # database.py
+import os
 import sqlite3
 import json
-from config import DB_PATH
+import time
+import queue
+import atexit
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+from config import DB_PATH, DB_WRITE_BEHIND, DB_MAX_LAG_MS, DB_BATCH_SIZE, DB_ID_BLOCK, DB_READ_POOL_SIZE
 
-def init_db():
+def _connect():
     conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+# Schema migrations applied by init_db, tracked in PRAGMA user_version
+_MIGRATIONS = [
+    (1, [
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_created ON conversations (user, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_task_logs_convo ON task_logs (convo_id)",
+        "CREATE INDEX IF NOT EXISTS idx_task_logs_tool_created ON task_logs (tool, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_task_logs_created ON task_logs (created_at)",
+    ]),
+    (2, [
+        """CREATE TABLE IF NOT EXISTS answer_cache (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT,
+            answer TEXT,
+            method TEXT,
+            confidence REAL,
+            created_at DATETIME DEFAULT (datetime('now'))
+        )""",
+    ]),
+]
+
+def _migrate(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, statements in _MIGRATIONS:
+        if target <= version:
+            continue
+        with conn:
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {target}")
+
+def init_db():
+    conn = _connect()
     cur = conn.cursor()
     cur.execute("""CREATE TABLE IF NOT EXISTS conversations (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -31,18 +74,185 @@ def init_db():
         created_at DATETIME DEFAULT (datetime('now'))
     )""")
     conn.commit()
+    _migrate(conn)
     return conn
 
-_db_conn = init_db()
+# Opened on first use (see _ensure_db), so importing this module stays cheap
+_db_conn = None
+_db_lock = threading.Lock()  # serialises use of _db_conn across threads
+_init_lock = threading.Lock()
+
+# -------------------------------------------------------------------
+# Primary keys handed out before the row is written
+# -------------------------------------------------------------------
+class _IdAllocator:
+    """
+    Reserves blocks of ids per table by bumping sqlite_sequence in one
+    short transaction. Rows can then be queued with their final id, and
+    other processes writing the same file get disjoint blocks.
+    """
+
+    def __init__(self, block: int = DB_ID_BLOCK):
+        self.block = block
+        self._lock = threading.Lock()
+        self._ranges = {}  # table -> [next_id, last_id]
+
+    def next(self, table: str) -> int:
+        with self._lock:
+            r = self._ranges.get(table)
+            if r is None or r[0] > r[1]:
+                r = self._ranges[table] = self._reserve(table)
+            rid = r[0]
+            r[0] += 1
+            return rid
+
+    def _reserve(self, table: str):
+        with _db_lock:
+            _db_conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = _db_conn.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,)).fetchone()
+                top = _db_conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+                start = max(row[0] if row else 0, top)
+                if row:
+                    _db_conn.execute("UPDATE sqlite_sequence SET seq=? WHERE name=?", (start + self.block, table))
+                else:
+                    _db_conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, start + self.block))
+                _db_conn.commit()
+            except Exception:
+                _db_conn.rollback()
+                raise
+        return [start + 1, start + self.block]
+
+# -------------------------------------------------------------------
+# Write-behind queue
+# -------------------------------------------------------------------
+class _WriteBehind:
+    """
+    Background thread that drains queued writes and commits them in
+    batches, one transaction per batch. A write waits at most max_lag
+    seconds before it is committed; flush() blocks until everything
+    queued so far is on disk.
+    """
+
+    def __init__(self, max_lag: float = DB_MAX_LAG_MS / 1000.0, batch_size: int = DB_BATCH_SIZE):
+        self.max_lag = max_lag
+        self.batch_size = batch_size
+        self.errors = 0
+        self._queue = queue.Queue()
+        self._conn = _connect()
+        self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql: str, params: tuple):
+        self._queue.put((sql, params))
+
+    def flush(self, timeout: float = None) -> bool:
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = None):
+        self.flush(timeout)
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, waiters, stop = [], [], False
+            deadline = time.monotonic() + self.max_lag
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or waiters or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+            for w in waiters:
+                w.set()
+            if stop:
+                self._conn.close()
+                return
+
+    def _commit(self, batch):
+        if not batch:
+            return
+        try:
+            with self._conn:
+                for sql, params in batch:
+                    self._conn.execute(sql, _resolve(params))
+        except Exception:
+            # One bad row must not take the rest of the batch with it
+            for sql, params in batch:
+                try:
+                    with self._conn:
+                        self._conn.execute(sql, _resolve(params))
+                except Exception:
+                    self.errors += 1
+
+def _resolve(params):
+    """Params may be a callable, so expensive serialization can run at write time."""
+    return params() if callable(params) else params
+
+_ids = None
+_writer = None
+_readers = None
+
+def _ensure_db():
+    """Create/migrate the database and start the writer and read pool, once per process."""
+    global _db_conn, _ids, _writer, _readers
+    if _db_conn is not None:
+        return
+    with _init_lock:
+        if _db_conn is not None:
+            return
+        os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+        conn = init_db()
+        _ids = _IdAllocator()
+        _writer = _WriteBehind() if DB_WRITE_BEHIND else None
+        if _writer is not None:
+            atexit.register(_writer.close)
+        _readers = _ReadPool()
+        _db_conn = conn
+
+def open_db():
+    """Open the database now rather than on the first write (e.g. when a worker process starts)."""
+    _ensure_db()
+
+def _next_id(table: str) -> int:
+    _ensure_db()
+    return _ids.next(table)
+
+def _write(sql: str, params: tuple):
+    """Queue a write (write-behind mode) or commit it immediately."""
+    _ensure_db()
+    if _writer is not None:
+        _writer.submit(sql, params)
+        return
+    with _db_lock:
+        _db_conn.execute(sql, _resolve(params))
+        _db_conn.commit()
+
+def flush_writes(timeout: float = None) -> bool:
+    """Block until every queued write is committed. Returns False on timeout."""
+    if _writer is None:
+        return True
+    return _writer.flush(timeout)
 
 def save_conversation(user, question, answer=None, method=None):
-    cur = _db_conn.cursor()
-    cur.execute(
-        "INSERT INTO conversations (user, question, answer, method) VALUES (?, ?, ?, ?)",
-        (user, question, answer, method)
+    convo_id = _next_id("conversations")
+    _write(
+        "INSERT INTO conversations (id, user, question, answer, method) VALUES (?, ?, ?, ?, ?)",
+        (convo_id, user, question, answer, method)
     )
-    _db_conn.commit()
-    return cur.lastrowid
+    return convo_id
 
 
 def update_conversation_answer(convo_id, answer, method):
@@ -50,31 +260,125 @@ def update_conversation_answer(convo_id, answer, method):
     Update the conversation record with the final answer and method.
     Converts dict answers to JSON strings automatically.
     """
-    cur = _db_conn.cursor()
-
     # Convert dicts to JSON string
     if isinstance(answer, dict):
         answer = json.dumps(answer)
 
-    cur.execute(
+    _write(
         "UPDATE conversations SET answer=?, method=? WHERE id=?",
         (answer, method, convo_id)
     )
-    _db_conn.commit()
 
 
 def save_task_log(convo_id, agent, tool, status, confidence, meta=None):
-    cur = _db_conn.cursor()
-    meta_json = json.dumps(meta or {})
-    cur.execute(
-        "INSERT INTO task_logs (convo_id, agent, tool, status, confidence, meta) VALUES (?, ?, ?, ?, ?, ?)",
-        (convo_id, agent, tool, status, confidence, meta_json)
-    )
-    _db_conn.commit()
-    return cur.lastrowid
+    """`meta` may also be a zero-argument callable; it is called (and serialized) when the row is written."""
+    log_id = _next_id("task_logs")
+    sql = "INSERT INTO task_logs (id, convo_id, agent, tool, status, confidence, meta) VALUES (?, ?, ?, ?, ?, ?, ?)"
+    if callable(meta):
+        _write(sql, lambda: (log_id, convo_id, agent, tool, status, confidence, json.dumps(meta() or {})))
+    else:
+        _write(sql, (log_id, convo_id, agent, tool, status, confidence, json.dumps(meta or {})))
+    return log_id
 
 def save_reflection(task_log_id, notes):
-    cur = _db_conn.cursor()
-    cur.execute("INSERT INTO reflection (task_log_id, notes) VALUES (?, ?)", (task_log_id, notes))
-    _db_conn.commit()
-    return cur.lastrowid
+    reflection_id = _next_id("reflection")
+    _write("INSERT INTO reflection (id, task_log_id, notes) VALUES (?, ?, ?)", (reflection_id, task_log_id, notes))
+    return reflection_id
+
+def save_cached_answer(key, fingerprint, answer, method, confidence):
+    """Store (or replace) an answer in the persistent answer cache."""
+    _write(
+        "INSERT OR REPLACE INTO answer_cache (key, fingerprint, answer, method, confidence) VALUES (?, ?, ?, ?, ?)",
+        (key, fingerprint, json.dumps(answer), method, confidence)
+    )
+
+# -------------------------------------------------------------------
+# Read side: pooled read-only connections and query helpers
+# -------------------------------------------------------------------
+class _ReadPool:
+    """
+    Small pool of read-only connections. In WAL mode readers never block
+    the writer (or each other). Reads see committed rows only, so rows
+    still queued in the write-behind buffer show up within DB_MAX_LAG_MS.
+    """
+
+    def __init__(self, size: int = DB_READ_POOL_SIZE):
+        self._uri = f"file:{pathname2url(DB_PATH)}?mode=ro"
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+            try:
+                yield conn
+            finally:
+                self._idle.put(conn)
+
+def _query(sql: str, params: tuple = ()) -> list:
+    _ensure_db()
+    with _readers.connection() as conn:
+        return [dict(row) for row in conn.execute(sql, params)]
+
+def recent_conversations(user, limit: int = 20) -> list:
+    """Most recent conversations of one user, newest first."""
+    return _query(
+        "SELECT id, user, question, answer, method, created_at FROM conversations "
+        "WHERE user=? ORDER BY created_at DESC, id DESC LIMIT ?",
+        (user, limit)
+    )
+
+def tool_success_rates(since: str = None) -> list:
+    """
+    Attempts, successes and success rate per tool from task_logs
+    (success is read from the logged result dict). Exported thought traces
+    (tool 'chain_of_thought') are not tool calls and are left out. `since`
+    is an SQLite datetime string such as '2024-01-01' or '2024-01-01 12:00:00'.
+    """
+    where, params = "WHERE tool != 'chain_of_thought'", ()
+    if since:
+        where, params = where + " AND created_at >= ?", (since,)
+    rows = _query(
+        "SELECT tool, COUNT(*) AS attempts, "
+        "SUM(CASE WHEN json_extract(meta, '$.success') THEN 1 ELSE 0 END) AS successes "
+        f"FROM task_logs {where} GROUP BY tool ORDER BY tool",
+        params
+    )
+    for row in rows:
+        row["success_rate"] = row["successes"] / row["attempts"] if row["attempts"] else 0.0
+    return rows
+
+def conversation_trace(convo_id) -> dict:
+    """A conversation and all of its task logs in order, with meta decoded."""
+    convo = _query(
+        "SELECT id, user, question, answer, method, created_at FROM conversations WHERE id=?",
+        (convo_id,)
+    )
+    logs = _query(
+        "SELECT id, agent, tool, status, confidence, meta, created_at FROM task_logs "
+        "WHERE convo_id=? ORDER BY id",
+        (convo_id,)
+    )
+    for log in logs:
+        try:
+            log["meta"] = json.loads(log["meta"]) if log["meta"] else {}
+        except ValueError:
+            pass
+    return {"conversation": convo[0] if convo else None, "task_logs": logs}
+
+def load_cached_answer(key):
+    """The persisted answer_cache row for `key` (answer decoded), or None."""
+    rows = _query("SELECT fingerprint, answer, method, confidence FROM answer_cache WHERE key=?", (key,))
+    if not rows:
+        return None
+    row = rows[0]
+    try:
+        row["answer"] = json.loads(row["answer"])
+    except (TypeError, ValueError):
+        return None
+    return row
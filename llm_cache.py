@@ -0,0 +1,142 @@
+# llm_cache.py
+"""
+Disk-backed cache of LLM completions (SQLite). Keys hash the provider,
+model, prompt and request parameters; completions are requested at
+temperature 0.0, so a repeat prompt can be answered without a network
+round trip. Entries expire after LLM_CACHE_TTL seconds, and the least
+recently used ones are evicted once the table holds more than
+LLM_CACHE_MAX_ENTRIES rows.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from config import LLM_CACHE_DB, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES
+
+
+def make_key(provider: str, model: str, prompt: str, params: dict = None) -> str:
+    raw = json.dumps([provider, model, prompt, params or {}], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Thread-safe SQLite store of result dicts keyed by make_key()."""
+
+    def __init__(self, db_path: str = LLM_CACHE_DB, ttl: float = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "stores": 0, "expirations": 0, "evictions": 0}
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                provider TEXT,
+                result TEXT,
+                stored_at REAL,
+                used_at REAL
+            )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_used ON llm_cache (used_at)")
+            if ttl > 0:
+                self._db.execute("DELETE FROM llm_cache WHERE stored_at < ?", (time.time() - ttl,))
+            self._db.commit()
+            self._rows = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    def get(self, key: str):
+        """The cached result dict, or None."""
+        if self._db is None:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT result, stored_at FROM llm_cache WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self._counts["misses"] += 1
+                return None
+            if self.ttl > 0 and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM llm_cache WHERE key=?", (key,))
+                self._db.commit()
+                self._rows -= 1
+                self._counts["expirations"] += 1
+                self._counts["misses"] += 1
+                return None
+            self._db.execute("UPDATE llm_cache SET used_at=? WHERE key=?", (now, key))
+            self._db.commit()
+            self._counts["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, provider: str, result: dict):
+        if self._db is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, provider, result, stored_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                (key, provider, json.dumps(result), now, now)
+            )
+            self._rows += 1  # upper bound (replacements count too); _evict recounts
+            self._counts["stores"] += 1
+            if self.max_entries > 0 and self._rows > self.max_entries:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # Trim to 90% of the cap so eviction runs once per batch of inserts, not on every one
+        self._rows = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        excess = self._rows - int(self.max_entries * 0.9)
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY used_at LIMIT ?)", (excess,)
+            )
+            self._rows -= excess
+            self._counts["evictions"] += excess
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counts["hits"] + self._counts["misses"]
+            return {**self._counts, "entries": self._rows if self._db is not None else 0,
+                    "max_entries": self.max_entries,
+                    "hit_rate": self._counts["hits"] / lookups if lookups else 0.0}
+
+    def clear(self):
+        with self._lock:
+            for k in self._counts:
+                self._counts[k] = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+                self._rows = 0
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def response_cache() -> LLMCache:
+    """The process-wide cache, opened on first use."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = LLMCache()
+    return _CACHE
+
+
+def llm_cache_stats() -> dict:
+    """Hit/miss/store/eviction counters and hit rate of the LLM response cache."""
+    return response_cache().stats()
+
+
+def clear_llm_cache():
+    response_cache().clear()
@@ -1,15 +1,225 @@
 # llm_clients.py
 import os
+import time
+import asyncio
+import weakref
+import random
+import threading
 import requests
 import json
-from config import OPENROUTER_API_KEY, OPENROUTER_BASE, MISTRAL_API_KEY, MISTRAL_BASE
+import hashlib
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from llm_cache import make_key, response_cache
+from metrics import histogram, counter
+HAS_HTTPX = importlib.util.find_spec("httpx") is not None  # optional: non-blocking client for agenerate
+from config import (
+    OPENROUTER_API_KEY, OPENROUTER_BASE, OPENROUTER_MODEL, MISTRAL_API_KEY, MISTRAL_BASE,
+    LLM_TIMEOUT, LLM_POOL_CONNECTIONS, LLM_POOL_MAXSIZE, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+    LLM_HEDGE, LLM_HEDGE_DELAY, LLM_ASYNC_MAX_CONNECTIONS,
+)
 
-def call_openrouter(prompt: str, model: str = "gpt-4o-mini", max_tokens: int = 512, timeout: int = 30):
-    if not OPENROUTER_API_KEY:
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# -------------------------------------------------------------------
+# Per-provider keep-alive sessions
+# -------------------------------------------------------------------
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(provider: str) -> requests.Session:
+    """Shared session for a provider; its connection pool keeps TCP/TLS connections alive."""
+    session = _sessions.get(provider)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(provider)
+            if session is None:
+                session = requests.Session()
+                # Retries are done in _post so they can honor Retry-After and feed the stats
+                adapter = HTTPAdapter(pool_connections=LLM_POOL_CONNECTIONS, pool_maxsize=LLM_POOL_MAXSIZE, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _sessions[provider] = session
+    return session
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+# -------------------------------------------------------------------
+# Per-provider counters
+# -------------------------------------------------------------------
+class ProviderStats:
+    """Request, retry, error and hedge-win counts plus latency totals for one provider. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0  # calls made through _post
+            self.attempts = 0  # HTTP attempts, retries included
+            self.retries = 0
+            self.errors = 0  # calls that ended in failure
+            self.latency_total = 0.0
+            self.latency_max = 0.0
+            self.last_error = None
+            self.wins = 0  # hedged races won
+            self.cancelled = 0  # calls abandoned because another provider won
+
+    def record(self, attempts: int, latency: float, error: str = None):
+        with self._lock:
+            self.requests += 1
+            self.attempts += attempts
+            self.retries += attempts - 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if error is not None:
+                self.errors += 1
+                self.last_error = error
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "errors": self.errors,
+                "latency_avg": self.latency_total / self.requests if self.requests else 0.0,
+                "latency_max": self.latency_max,
+                "last_error": self.last_error,
+                "wins": self.wins,
+                "cancelled": self.cancelled,
+            }
+
+    def count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+_stats = {}
+
+def _provider_stats(provider: str) -> ProviderStats:
+    stats = _stats.get(provider)
+    if stats is None:
+        with _sessions_lock:
+            stats = _stats.setdefault(provider, ProviderStats())
+    return stats
+
+_HTTP_SECONDS = histogram("mathwiz_llm_http_seconds", "Provider HTTP calls, retries included")
+_PROVIDER_ERRORS = counter("mathwiz_llm_provider_errors_total", "Provider calls that failed after retries")
+_PROVIDER_RETRIES = counter("mathwiz_llm_retries_total", "Extra HTTP attempts per provider")
+_GENERATE_SECONDS = histogram("mathwiz_llm_generate_seconds", "generate/agenerate/generate_stream, by answering source")
+_RESPONSE_CACHE = counter("mathwiz_llm_cache_total", "LLM response cache lookups")
+
+def _record(provider: str, attempts: int, latency: float, error: str = None):
+    """Feed one finished provider call into its ProviderStats and the metrics."""
+    _provider_stats(provider).record(attempts, latency, error)
+    _HTTP_SECONDS.observe(latency, provider=provider)
+    if attempts > 1:
+        _PROVIDER_RETRIES.inc(attempts - 1, provider=provider)
+    if error is not None:
+        _PROVIDER_ERRORS.inc(provider=provider)
+
+def _observe_generate(t0: float, res: dict, api: str):
+    source = "cache" if res.get("cached") else res.get("provider") or res.get("model") or "none"
+    _GENERATE_SECONDS.observe(time.perf_counter() - t0, api=api, source=source)
+
+def provider_stats() -> dict:
+    """{provider: counters} for every provider called so far."""
+    return {name: stats.snapshot() for name, stats in list(_stats.items())}
+
+def reset_provider_stats():
+    for stats in list(_stats.values()):
+        stats.reset()
+
+# -------------------------------------------------------------------
+# POST with jittered exponential backoff
+# -------------------------------------------------------------------
+def _retry_after(response) -> float:
+    """Seconds requested by a Retry-After header (delta or HTTP date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
         return None
-    url = f"{OPENROUTER_BASE}/chat/completions"
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential delay before retry number `attempt` (0-based)."""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+class Cancelled(Exception):
+    """The call was abandoned because another provider already answered."""
+
+def _post(provider: str, url: str, headers: dict, payload: dict, timeout: float = LLM_TIMEOUT,
+          max_retries: int = LLM_MAX_RETRIES, cancel: threading.Event = None, stream: bool = False):
+    """
+    POST JSON through the provider's session and return the decoded body
+    (or, with stream=True, the open response once its headers are in).
+    Connection errors, timeouts and 429/5xx replies are retried up to
+    max_retries times; anything else (or the last failure) raises.
+    Setting `cancel` stops any further attempt or backoff wait, and a reply
+    that arrives after it is set is dropped.
+    """
+    session = get_session(provider)
+    t0 = time.perf_counter()
+    attempt = 0
+    while True:
+        if cancel is not None and cancel.is_set():
+            _provider_stats(provider).count("cancelled")
+            raise Cancelled(provider)
+        attempt += 1
+        delay = None
+        try:
+            r = session.post(url, headers=headers, json=payload, timeout=timeout, stream=stream)
+            if cancel is not None and cancel.is_set():
+                # Lost the race while the request was in flight: drop the answer
+                r.close()
+                _provider_stats(provider).count("cancelled")
+                raise Cancelled(provider)
+            if r.status_code in RETRY_STATUSES and attempt <= max_retries:
+                delay = _retry_after(r)
+                if delay is not None and delay > LLM_BACKOFF_MAX:
+                    # The provider asked for a longer pause than we are willing to wait
+                    r.raise_for_status()
+                r.close()
+            else:
+                r.raise_for_status()
+                data = r if stream else r.json()
+                _record(provider, attempt, time.perf_counter() - t0)
+                return data
+        except Cancelled:
+            raise
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt > max_retries:
+                _record(provider, attempt, time.perf_counter() - t0, str(e))
+                raise
+        except Exception as e:
+            _record(provider, attempt, time.perf_counter() - t0, str(e))
+            raise
+        pause = delay if delay is not None else _backoff(attempt - 1)
+        if cancel is not None:
+            cancel.wait(pause)
+        else:
+            time.sleep(pause)
+
+# -------------------------------------------------------------------
+# Providers
+# -------------------------------------------------------------------
+def _openrouter_request(prompt: str, model: str, max_tokens: int, base_url: str, api_key: str):
+    url = f"{base_url or OPENROUTER_BASE}/chat/completions"
     headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
     body = {
@@ -18,44 +228,409 @@ def call_openrouter(prompt: str, model: str = "gpt-4o-mini", max_tokens: int = 5
         "max_tokens": max_tokens,
         "temperature": 0.0
     }
+    return url, headers, body
+
+def _openrouter_result(data: dict, model: str) -> dict:
+    if "choices" in data and len(data["choices"])>0:
+        text = data["choices"][0].get("message", {}).get("content") or data["choices"][0].get("text")
+        return {"success": True, "model": model, "text": text, "meta": data}
+    return {"success": True, "model": model, "text": json.dumps(data), "meta": data}
+
+def _generic_request(prompt: str, api_key: str, model: str):
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type":"application/json"}
+    payload = {"prompt": prompt}
+    if model:
+        payload["model"] = model
+    return headers, payload
+
+def _generic_result(data: dict, model: str) -> dict:
+    text = data.get("text") or data.get("output") or data.get("result") or json.dumps(data)
+    return {"success": True, "model": model or "generic-http", "text": text, "meta": data}
+
+def call_openrouter(prompt: str, model: str = OPENROUTER_MODEL, max_tokens: int = 512, timeout: float = LLM_TIMEOUT,
+                    base_url: str = None, api_key: str = None, cancel: threading.Event = None):
+    api_key = OPENROUTER_API_KEY if api_key is None else api_key
+    if not api_key:
+        return None
+    url, headers, body = _openrouter_request(prompt, model, max_tokens, base_url, api_key)
     try:
-        r = requests.post(url, headers=headers, json=body, timeout=timeout)
-        r.raise_for_status()
-        data = r.json()
-        if "choices" in data and len(data["choices"])>0:
-            text = data["choices"][0].get("message", {}).get("content") or data["choices"][0].get("text")
-            return {"success": True, "model": model, "text": text, "meta": data}
-        return {"success": True, "model": model, "text": json.dumps(data), "meta": data}
+        data = _post("openrouter", url, headers, body, timeout=timeout, cancel=cancel)
+        return _openrouter_result(data, model)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def call_generic_http(prompt: str, base_url: str, api_key: str, model: str = None, timeout: int = 30):
+def call_generic_http(prompt: str, base_url: str, api_key: str, model: str = None, timeout: float = LLM_TIMEOUT,
+                      provider: str = "generic", cancel: threading.Event = None):
     if not api_key or not base_url:
         return None
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type":"application/json"}
-    payload = {"prompt": prompt}
-    if model:
-        payload["model"] = model
+    headers, payload = _generic_request(prompt, api_key, model)
     try:
-        r = requests.post(base_url, headers=headers, json=payload, timeout=timeout)
-        r.raise_for_status()
-        data = r.json()
-        text = data.get("text") or data.get("output") or data.get("result") or json.dumps(data)
-        return {"success": True, "model": model or "generic-http", "text": text, "meta": data}
+        data = _post(provider, base_url, headers, payload, timeout=timeout, cancel=cancel)
+        return _generic_result(data, model)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def generate(prompt: str, prefer_openrouter: bool = True, openrouter_model: str = "gpt-4o-mini", fallbacks: bool = True):
+# -------------------------------------------------------------------
+# Streaming (server-sent events)
+# -------------------------------------------------------------------
+def _sse_data(lines):
+    """Payloads of the `data:` lines of an SSE stream, up to [DONE]. Comments and blanks are skipped."""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        yield data
+
+def stream_openrouter(prompt: str, model: str = OPENROUTER_MODEL, max_tokens: int = 512, timeout: float = LLM_TIMEOUT,
+                      base_url: str = None, api_key: str = None):
+    """
+    Yield completion text pieces as OpenRouter streams them. Failures
+    before the stream opens are retried like call_openrouter; errors
+    raise (including mid-stream ones).
+    """
+    api_key = OPENROUTER_API_KEY if api_key is None else api_key
+    if not api_key:
+        return
+    url, headers, body = _openrouter_request(prompt, model, max_tokens, base_url, api_key)
+    body["stream"] = True
+    r = _post("openrouter", url, headers, body, timeout=timeout, stream=True)
+    with r:
+        # chunk_size=None hands over each chunk as it arrives instead of filling a 512-byte buffer
+        for data in _sse_data(r.iter_lines(chunk_size=None)):
+            choices = json.loads(data).get("choices") or [{}]
+            piece = (choices[0].get("delta") or {}).get("content") or choices[0].get("text")
+            if piece:
+                yield piece
+
+def generate_stream(prompt: str, prefer_openrouter: bool = True, openrouter_model: str = OPENROUTER_MODEL,
+                    fallbacks: bool = True, use_cache: bool = True):
+    """
+    Streaming generate(): a generator that yields text pieces and returns
+    the final result dict, which adds "ttft" (seconds to the first piece).
+    OpenRouter is streamed; if it fails before any text arrives, the
+    non-streaming providers (and stub) answer as one piece. A stream cut
+    off midway returns success=False with the partial text. Cached
+    responses come back as a single piece.
+    """
+    t0 = time.perf_counter()
+    res = yield from _generate_stream(prompt, prefer_openrouter, openrouter_model, fallbacks, use_cache)
+    _observe_generate(t0, res, "stream")
+    return res
+
+def _generate_stream(prompt, prefer_openrouter, openrouter_model, fallbacks, use_cache):
+    keys = _cache_keys(prompt, prefer_openrouter, openrouter_model) if use_cache else []
+    res = _cached(keys)
+    if res is not None:
+        yield res.get("text") or ""
+        return {**res, "ttft": 0.0}
     if prefer_openrouter and OPENROUTER_API_KEY:
-        res = call_openrouter(prompt, model=openrouter_model)
-        if res and res.get("success"):
-            return res
-    # try Mistral generic
+        t0 = time.perf_counter()
+        pieces, ttft = [], None
+        try:
+            for piece in stream_openrouter(prompt, model=openrouter_model):
+                if ttft is None:
+                    ttft = time.perf_counter() - t0
+                pieces.append(piece)
+                yield piece
+        except Exception as e:
+            if pieces:
+                return {"success": False, "model": openrouter_model, "text": "".join(pieces), "error": str(e),
+                        "provider": "openrouter", "latency": time.perf_counter() - t0, "ttft": ttft}
+        else:
+            if pieces:
+                res = {"success": True, "model": openrouter_model, "text": "".join(pieces),
+                       "provider": "openrouter", "latency": time.perf_counter() - t0, "ttft": ttft}
+                _remember(keys, res)
+                return res
+    t0 = time.perf_counter()
+    res = _generate(prompt, False, openrouter_model, fallbacks, None, None, use_cache)
+    if res.get("success"):
+        yield res.get("text") or ""
+    return {**res, "ttft": time.perf_counter() - t0}
+
+def _providers(prefer_openrouter: bool = True, openrouter_model: str = OPENROUTER_MODEL) -> list:
+    """Configured providers in priority order, as (name, fn(prompt, cancel))."""
+    providers = []
+    if prefer_openrouter and OPENROUTER_API_KEY:
+        providers.append(("openrouter", lambda p, cancel=None: call_openrouter(p, model=openrouter_model, cancel=cancel)))
     if MISTRAL_API_KEY and MISTRAL_BASE:
-        res = call_generic_http(prompt, base_url=MISTRAL_BASE, api_key=MISTRAL_API_KEY)
+        providers.append(("mistral", lambda p, cancel=None: call_generic_http(
+            p, base_url=MISTRAL_BASE, api_key=MISTRAL_API_KEY, provider="mistral", cancel=cancel)))
+    return providers
+
+def _sequential(prompt: str, providers: list):
+    for name, fn in providers:
+        t0 = time.perf_counter()
+        res = fn(prompt)
         if res and res.get("success"):
-            return res
+            return {**res, "provider": name, "latency": time.perf_counter() - t0}
+    return None
+
+def _hedged(prompt: str, providers: list, delay: float):
+    """
+    Start the first provider; start the next one when `delay` seconds pass
+    without a successful answer, or as soon as a running call fails.
+    The first success wins and the others are cancelled.
+    Each call gets its own threads (one per provider): a loser still
+    unwinding its request must not hold a thread another call is waiting for.
+    """
+    pool = ThreadPoolExecutor(max_workers=len(providers), thread_name_prefix="llm-hedge")
+    cancel = threading.Event()
+    t0 = time.perf_counter()
+    pending = {}
+    waiting = list(providers)
+
+    def launch():
+        name, fn = waiting.pop(0)
+        pending[pool.submit(fn, prompt, cancel)] = name
+
+    launch()
+    try:
+        while pending:
+            timeout = delay if waiting else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                launch()  # hedge: the running providers are too slow
+                continue
+            for fut in done:
+                name = pending.pop(fut)
+                res = fut.result()
+                if res and res.get("success"):
+                    _provider_stats(name).count("wins")
+                    return {**res, "provider": name, "latency": time.perf_counter() - t0}
+            if waiting and len(pending) == 0:
+                launch()  # everything running failed: don't wait out the delay
+        return None
+    finally:
+        cancel.set()
+        for fut, name in pending.items():
+            if fut.cancel():
+                _provider_stats(name).count("cancelled")  # never started
+        pool.shutdown(wait=False)
+
+def _cache_keys(prompt: str, prefer_openrouter: bool = True, openrouter_model: str = OPENROUTER_MODEL) -> list:
+    """(provider, response-cache key) for each configured provider, in priority order."""
+    keys = []
+    if prefer_openrouter and OPENROUTER_API_KEY:
+        params = {"base": OPENROUTER_BASE, "max_tokens": 512, "temperature": 0.0}
+        keys.append(("openrouter", make_key("openrouter", openrouter_model, prompt, params)))
+    if MISTRAL_API_KEY and MISTRAL_BASE:
+        keys.append(("mistral", make_key("mistral", None, prompt, {"base": MISTRAL_BASE})))
+    return keys
+
+def _cached(keys: list):
+    for _, key in keys:
+        res = response_cache().get(key)
+        if res is not None:
+            _RESPONSE_CACHE.inc(result="hit")
+            return {**res, "cached": True, "latency": 0.0}
+    if keys:
+        _RESPONSE_CACHE.inc(result="miss")
+    return None
+
+def _remember(keys: list, res: dict):
+    """Store a successful provider result under that provider's key (stub replies never match)."""
+    for provider, key in keys:
+        if provider == res.get("provider"):
+            response_cache().put(key, provider, {k: v for k, v in res.items() if k not in ("latency", "ttft", "cached")})
+
+def generate(prompt: str, prefer_openrouter: bool = True, openrouter_model: str = OPENROUTER_MODEL, fallbacks: bool = True,
+             hedge: bool = None, hedge_delay: float = None, use_cache: bool = True):
+    """
+    Ask the configured providers (OpenRouter, then Mistral) for a completion.
+    With hedge (default LLM_HEDGE) the backup provider is raced after
+    hedge_delay seconds instead of after the first one gives up. Successful
+    results carry the answering "provider" and its "latency" in seconds.
+    Repeat prompts are served from the response cache ("cached": True)
+    unless use_cache is False.
+    """
+    t0 = time.perf_counter()
+    res = _generate(prompt, prefer_openrouter, openrouter_model, fallbacks, hedge, hedge_delay, use_cache)
+    _observe_generate(t0, res, "sync")
+    return res
+
+def _generate(prompt, prefer_openrouter, openrouter_model, fallbacks, hedge, hedge_delay, use_cache):
+    keys = _cache_keys(prompt, prefer_openrouter, openrouter_model) if use_cache else []
+    res = _cached(keys)
+    if res is not None:
+        return res
+    providers = _providers(prefer_openrouter, openrouter_model)
+    hedge = LLM_HEDGE if hedge is None else hedge
+    if hedge and len(providers) > 1:
+        res = _hedged(prompt, providers, LLM_HEDGE_DELAY if hedge_delay is None else hedge_delay)
+    else:
+        res = _sequential(prompt, providers)
+    if res is not None:
+        _remember(keys, res)
+        return res
     # fallback stub
     if fallbacks:
         return {"success": True, "model": "stub", "text": f"[LLM-stub] {prompt[:1000]}"}
     return {"success": False, "error": "No LLM available"}
+
+# -------------------------------------------------------------------
+# Async variants (httpx); without httpx, agenerate runs generate() on a thread
+# -------------------------------------------------------------------
+def get_async_client(provider: str):
+    """httpx.AsyncClient for a provider, one per running event loop (clients can't cross loops)."""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(provider)
+    if client is None:
+        import httpx
+        limits = httpx.Limits(max_connections=LLM_ASYNC_MAX_CONNECTIONS, max_keepalive_connections=LLM_POOL_MAXSIZE)
+        client = clients[provider] = httpx.AsyncClient(limits=limits)
+    return client
+
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {provider: AsyncClient}
+
+async def _apost(provider: str, url: str, headers: dict, payload: dict, timeout: float = LLM_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES) -> dict:
+    """Async _post: same retry, Retry-After and stats rules. Task cancellation aborts the request."""
+    import httpx
+    client = get_async_client(provider)
+    t0 = time.perf_counter()
+    attempt = 0
+    try:
+        while True:
+            attempt += 1
+            delay = None
+            try:
+                r = await client.post(url, headers=headers, json=payload, timeout=timeout)
+                if r.status_code in RETRY_STATUSES and attempt <= max_retries:
+                    delay = _retry_after(r)
+                    if delay is not None and delay > LLM_BACKOFF_MAX:
+                        r.raise_for_status()
+                else:
+                    r.raise_for_status()
+                    data = r.json()
+                    _record(provider, attempt, time.perf_counter() - t0)
+                    return data
+            except httpx.TransportError as e:
+                if attempt > max_retries:
+                    _record(provider, attempt, time.perf_counter() - t0, str(e))
+                    raise
+            except Exception as e:
+                _record(provider, attempt, time.perf_counter() - t0, str(e))
+                raise
+            await asyncio.sleep(delay if delay is not None else _backoff(attempt - 1))
+    except asyncio.CancelledError:
+        _provider_stats(provider).count("cancelled")
+        raise
+
+async def acall_openrouter(prompt: str, model: str = OPENROUTER_MODEL, max_tokens: int = 512, timeout: float = LLM_TIMEOUT,
+                           base_url: str = None, api_key: str = None):
+    api_key = OPENROUTER_API_KEY if api_key is None else api_key
+    if not api_key:
+        return None
+    url, headers, body = _openrouter_request(prompt, model, max_tokens, base_url, api_key)
+    try:
+        data = await _apost("openrouter", url, headers, body, timeout=timeout)
+        return _openrouter_result(data, model)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+async def acall_generic_http(prompt: str, base_url: str, api_key: str, model: str = None, timeout: float = LLM_TIMEOUT,
+                             provider: str = "generic"):
+    if not api_key or not base_url:
+        return None
+    headers, payload = _generic_request(prompt, api_key, model)
+    try:
+        data = await _apost(provider, base_url, headers, payload, timeout=timeout)
+        return _generic_result(data, model)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def _aproviders(prefer_openrouter: bool = True, openrouter_model: str = OPENROUTER_MODEL) -> list:
+    """Async counterpart of _providers: (name, async fn(prompt))."""
+    providers = []
+    if prefer_openrouter and OPENROUTER_API_KEY:
+        providers.append(("openrouter", lambda p: acall_openrouter(p, model=openrouter_model)))
+    if MISTRAL_API_KEY and MISTRAL_BASE:
+        providers.append(("mistral", lambda p: acall_generic_http(
+            p, base_url=MISTRAL_BASE, api_key=MISTRAL_API_KEY, provider="mistral")))
+    return providers
+
+async def _asequential(prompt: str, providers: list):
+    for name, fn in providers:
+        t0 = time.perf_counter()
+        res = await fn(prompt)
+        if res and res.get("success"):
+            return {**res, "provider": name, "latency": time.perf_counter() - t0}
+    return None
+
+async def _ahedged(prompt: str, providers: list, delay: float):
+    """Async _hedged; losing requests are cancelled outright."""
+    t0 = time.perf_counter()
+    pending = {}
+    waiting = list(providers)
+
+    def launch():
+        name, fn = waiting.pop(0)
+        pending[asyncio.ensure_future(fn(prompt))] = name
+
+    launch()
+    try:
+        while pending:
+            timeout = delay if waiting else None
+            done, _ = await asyncio.wait(list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            for task in done:
+                name = pending.pop(task)
+                res = task.result()
+                if res and res.get("success"):
+                    _provider_stats(name).count("wins")
+                    return {**res, "provider": name, "latency": time.perf_counter() - t0}
+            if waiting and len(pending) == 0:
+                launch()
+        return None
+    finally:
+        for task, name in pending.items():
+            if task.cancel():
+                _provider_stats(name).count("cancelled")
+
+async def agenerate(prompt: str, prefer_openrouter: bool = True, openrouter_model: str = OPENROUTER_MODEL,
+                    fallbacks: bool = True, hedge: bool = None, hedge_delay: float = None, use_cache: bool = True):
+    """Non-blocking generate(): same providers, hedging, response cache and stub fallback."""
+    if not HAS_HTTPX:
+        return await asyncio.to_thread(generate, prompt, prefer_openrouter, openrouter_model, fallbacks,
+                                       hedge, hedge_delay, use_cache)
+    t0 = time.perf_counter()
+    res = await _agenerate(prompt, prefer_openrouter, openrouter_model, fallbacks, hedge, hedge_delay, use_cache)
+    _observe_generate(t0, res, "async")
+    return res
+
+async def _agenerate(prompt, prefer_openrouter, openrouter_model, fallbacks, hedge, hedge_delay, use_cache):
+    keys = _cache_keys(prompt, prefer_openrouter, openrouter_model) if use_cache else []
+    res = await asyncio.to_thread(_cached, keys) if keys else None  # SQLite: keep it off the loop
+    if res is not None:
+        return res
+    providers = _aproviders(prefer_openrouter, openrouter_model)
+    hedge = LLM_HEDGE if hedge is None else hedge
+    if hedge and len(providers) > 1:
+        res = await _ahedged(prompt, providers, LLM_HEDGE_DELAY if hedge_delay is None else hedge_delay)
+    else:
+        res = await _asequential(prompt, providers)
+    if res is not None:
+        if keys:
+            await asyncio.to_thread(_remember, keys, res)
+        return res
+    if fallbacks:
+        return {"success": True, "model": "stub", "text": f"[LLM-stub] {prompt[:1000]}"}
+    return {"success": False, "error": "No LLM available"}
+
+def config_fingerprint() -> str:
+    """Short hash of the provider setup; changes when keys, endpoints or the model change."""
+    parts = [
+        hashlib.sha256(OPENROUTER_API_KEY.encode()).hexdigest() if OPENROUTER_API_KEY else "",
+        OPENROUTER_BASE, OPENROUTER_MODEL,
+        hashlib.sha256(MISTRAL_API_KEY.encode()).hexdigest() if MISTRAL_API_KEY else "",
+        MISTRAL_BASE,
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()[:16]
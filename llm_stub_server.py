@@ -0,0 +1,181 @@
+# llm_stub_server.py
+"""
+Local fake LLM provider for exercising llm_clients offline.
+Speaks the OpenAI-style POST {base}/chat/completions (JSON, or SSE when the
+body asks for "stream": true); any other POST path answers like the
+generic-HTTP provider with {"text": ...}. Delay, failures and Retry-After
+are configurable so retry, hedging and timeout paths can be driven.
+
+Usage: python llm_stub_server.py [--port 8099] [--delay 0.2] [--fail-first 2] [--status 503] [--retry-after 1]
+In code:
+    with StubLLMServer(delay=0.1) as srv:
+        call_openrouter("hi", base_url=srv.base_url, api_key="test")
+"""
+
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def setup(self):
+        super().setup()
+        self.server.stub._count("connections")
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up on the request (hedging, speculation, timeouts)
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            payload = {}
+        n = stub._count("requests")
+        if stub.slow_every and n % stub.slow_every == 0:
+            time.sleep(stub.slow_delay)
+        elif stub.delay:
+            time.sleep(stub.delay)
+
+        if n <= stub.fail_first:
+            headers = {"Retry-After": str(stub.retry_after)} if stub.retry_after is not None else None
+            self._send_json(stub.status, {"error": {"message": f"stub failure {n}"}}, headers)
+            return
+
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            messages = payload.get("messages") or [{}]
+            text = stub.reply.format(prompt=messages[-1].get("content", ""), n=n, name=stub.name)
+            if payload.get("stream"):
+                self._stream(payload.get("model"), text)
+                return
+            if stub.token_delay:
+                time.sleep(stub.token_delay * len(text.split(" ")))  # same generation time as a stream
+            self._send_json(200, {
+                "id": f"stub-{n}",
+                "object": "chat.completion",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            })
+        else:
+            text = stub.reply.format(prompt=payload.get("prompt", ""), n=n, name=stub.name)
+            self._send_json(200, {"text": text})
+
+    def _stream(self, model, text: str):
+        """Server-sent events over chunked encoding, one word per event, then [DONE]."""
+        stub = self.server.stub
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if stub.token_delay:
+                time.sleep(stub.token_delay)
+            piece = word if i == 0 else " " + word
+            chunk = {"object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512  # the default backlog of 5 drops connections under concurrent load
+
+
+class StubLLMServer:
+    """
+    Threaded fake provider on 127.0.0.1. The first `fail_first` requests get
+    `status` (with Retry-After if set); every request sleeps `delay` seconds
+    first, or `slow_delay` for every `slow_every`-th one (a latency tail).
+    `reply` may use {prompt}, {n} (request number) and {name}.
+    """
+
+    def __init__(self, port: int = 0, delay: float = 0.0, fail_first: int = 0, status: int = 503,
+                 retry_after=None, reply: str = "[{name}] {prompt}", token_delay: float = 0.0, name: str = "stub-llm",
+                 slow_every: int = 0, slow_delay: float = 0.0):
+        self.delay = delay
+        self.slow_every = slow_every
+        self.slow_delay = slow_delay
+        self.fail_first = fail_first
+        self.status = status
+        self.retry_after = retry_after
+        self.reply = reply
+        self.token_delay = token_delay
+        self.name = name
+        self.counts = {"requests": 0, "connections": 0}
+        self._lock = threading.Lock()
+        self._httpd = _Server(("127.0.0.1", port), _Handler)
+        self._httpd.stub = self
+        self._thread = None
+
+    def _count(self, key: str) -> int:
+        with self._lock:
+            self.counts[key] += 1
+            return self.counts[key]
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--fail-first", type=int, default=0)
+    parser.add_argument("--status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    args = parser.parse_args()
+    srv = StubLLMServer(port=args.port, delay=args.delay, fail_first=args.fail_first, status=args.status,
+                        retry_after=args.retry_after, token_delay=args.token_delay)
+    print(f"stub LLM listening on {srv.base_url}  (OPENROUTER_BASE={srv.base_url})")
+    try:
+        srv._httpd.serve_forever()
+    except KeyboardInterrupt:
+        srv._httpd.server_close()
@@ -1,26 +1,140 @@
 # main.py
+import json
+import time
+import asyncio
+import weakref
+import threading
 from coordinator import classify_question
 from delegator import assign_agent
+from answer_cache import lookup, store
+from database import save_conversation, save_task_log
+from thought_trace import log_thought, begin_trace, use_trace, current_trace
+from config import ASYNC_MAX_CONCURRENCY
+from async_runtime import run_sync
+from metrics import histogram, start_metrics_server
 
-def answer_question(question: str, user: str = "anonymous") -> dict:
+_QUESTION_SECONDS = histogram("mathwiz_question_seconds", "answer_question end to end, queueing included")
+start_metrics_server()  # only if METRICS_PORT is set
+
+_limits = weakref.WeakKeyDictionary()  # event loop -> Semaphore (asyncio primitives are per-loop)
+
+def _limiter() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _limits.get(loop)
+    if sem is None:
+        sem = _limits[loop] = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+    return sem
+
+# Streams run on the caller's thread, not the loop, so they share a thread semaphore
+_stream_limit = threading.BoundedSemaphore(ASYNC_MAX_CONCURRENCY)
+
+def _serve_cached(question: str, user: str, category: str, hit) -> dict:
+    """Log a cache hit like any other answered question and return it."""
+    answer, method, confidence = hit
+    convo_id = save_conversation(user, question, json.dumps(answer), "answer_cache")
+    current_trace().convo_id = convo_id
+    save_task_log(convo_id, category.lower(), "answer_cache", "hit", confidence,
+                  meta={"success": True, "source_method": method})
+    log_thought("answer_cache_hit", {"question": question, "source_method": method})
+    return {"category": category, "answer": answer, "method": "answer_cache",
+            "confidence": confidence, "source_method": method}
+
+def _export_trace(trace, category: str):
+    """Write the question's trace to task_logs as one row, serialized on the DB writer thread."""
+    if trace.convo_id is not None and len(trace):
+        save_task_log(trace.convo_id, category.lower(), "chain_of_thought", "trace", 0.0,
+                      meta=trace.deferred_export())
+
+async def answer_question_async(question: str, user: str = "anonymous", use_cache: bool = True, trace=None) -> dict:
     """
     Main entry point for handling a math question.
     1. Classifies question category
-    2. Assigns the correct agent
-    3. Returns agent-handled answer
+    2. Serves repeats from the answer cache
+    3. Otherwise assigns the correct agent
+    4. Returns agent-handled answer
+    At most ASYNC_MAX_CONCURRENCY questions per event loop run at once.
+    Steps are logged to `trace` (a fresh one by default) and exported to
+    task_logs at the end.
     """
+    if trace is None:
+        trace = begin_trace()
+    else:
+        use_trace(trace)
+    t0 = time.perf_counter()
+
     # 1) Classify question category
     cls = classify_question(question)
     category = cls.get("category", "general")
 
-    # 2) Assign agent
+    # 2) Repeat question under the same index and LLM config
+    if use_cache:
+        # SQLite reads/writes (and the first-call numpy import) stay off the loop
+        hit = await asyncio.to_thread(lookup, question, category)
+        if hit is not None:
+            response = await asyncio.to_thread(_serve_cached, question, user, category, hit)
+            await asyncio.to_thread(_export_trace, trace, category)
+            _QUESTION_SECONDS.observe(time.perf_counter() - t0, method="answer_cache")
+            return response
+
+    # 3) Assign agent
     agent = assign_agent(category)
 
-    # 3) Let agent handle the question
-    result = agent.handle(question, convo_user=user)
+    # 4) Let agent handle the question
+    async with _limiter():
+        result = await agent.handle_async(question, convo_user=user)
+    if use_cache:
+        await asyncio.to_thread(store, question, category, result)
+    await asyncio.to_thread(_export_trace, trace, category)
+    _QUESTION_SECONDS.observe(time.perf_counter() - t0, method=result.get("method", "unknown"))
 
-    # 4) Return structured response
+    # 5) Return structured response
     return {
         "category": category,
         **result
     }
+
+def answer_question(question: str, user: str = "anonymous", use_cache: bool = True) -> dict:
+    """
+    Blocking wrapper around answer_question_async. The trace is started in
+    the caller's context, so get_chain_of_thought() there returns it.
+    """
+    trace = begin_trace()
+    return run_sync(answer_question_async(question, user=user, use_cache=use_cache, trace=trace))
+
+def answer_question_stream(question: str, user: str = "anonymous", use_cache: bool = True):
+    """
+    Streaming answer_question for UIs. Yields {"event": "token", "text": piece}
+    for each LLM text piece as it arrives, then one {"event": "done", ...}
+    carrying the same dict answer_question returns. Solver, RAG and cached
+    answers produce only the "done" event.
+    At most ASYNC_MAX_CONCURRENCY streams run the agent pipeline at once.
+    """
+    trace = begin_trace()
+    t0 = time.perf_counter()
+    cls = classify_question(question)
+    category = cls.get("category", "general")
+
+    if use_cache:
+        hit = lookup(question, category)
+        if hit is not None:
+            response = _serve_cached(question, user, category, hit)
+            _export_trace(trace, category)
+            _QUESTION_SECONDS.observe(time.perf_counter() - t0, method="answer_cache")
+            yield {"event": "done", **response}
+            return
+
+    agent = assign_agent(category)
+    with _stream_limit:
+        stream = agent.handle_stream(question, convo_user=user)
+        while True:
+            try:
+                piece = next(stream)
+            except StopIteration as stop:
+                result = stop.value
+                break
+            yield {"event": "token", "text": piece}
+    if use_cache:
+        store(question, category, result)
+    _export_trace(trace, category)
+    _QUESTION_SECONDS.observe(time.perf_counter() - t0, method=result.get("method", "unknown"))
+    yield {"event": "done", "category": category, **result}
@@ -0,0 +1,257 @@
+# metrics.py
+"""
+In-process latency histograms and counters for the question pipeline.
+Modules declare their metrics once at import (histogram()/counter()) and
+record with observe()/inc() or the .time() context manager. A record is
+one bisect and one short lock, so the instrumentation stays on by default
+(METRICS_ENABLED=0 turns every record into a no-op).
+
+Export: snapshot() as a JSON-safe dict, prometheus_text() in the
+Prometheus text format, and serve_metrics() for a local HTTP endpoint
+(/metrics and /metrics.json), started by main when METRICS_PORT is set.
+"""
+
+import json
+import time
+import bisect
+import threading
+
+from config import METRICS_ENABLED, METRICS_PORT, METRICS_HOST
+
+# Seconds; spans the numeric fast path (sub-ms) up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _key(labels: dict) -> tuple:
+    items = tuple(labels.items())
+    return items if len(items) < 2 else tuple(sorted(items))
+
+
+def _label_text(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+class _Timer:
+    """Context manager that observes the elapsed time if the block exits normally."""
+
+    __slots__ = ("hist", "labels", "t0")
+
+    def __init__(self, hist, labels: dict):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.hist.observe(time.perf_counter() - self.t0, **self.labels)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label set. Thread-safe."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str = "", buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # label key -> [per-bucket counts (last = +Inf), sum, count]
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        key = _key(labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def _quantile(self, counts: list, total: int, q: float) -> float:
+        """Estimate from the buckets, interpolating linearly inside the bucket that holds it."""
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return 0.0
+
+    def snapshot(self) -> list:
+        with self._lock:
+            series = [(k, list(s[0]), s[1], s[2]) for k, s in self._series.items()]
+        out = []
+        for key, counts, total, n in series:
+            out.append({
+                "labels": dict(key), "count": n, "sum": total, "avg": total / n if n else 0.0,
+                "p50": self._quantile(counts, n, 0.50), "p95": self._quantile(counts, n, 0.95),
+                "p99": self._quantile(counts, n, 0.99),
+            })
+        return out
+
+    def _prometheus(self) -> list:
+        with self._lock:
+            series = [(k, list(s[0]), s[1], s[2]) for k, s in self._series.items()]
+        lines = []
+        for key, counts, total, n in sorted(series):
+            running = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                running += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_label_text(key, (('le', le),))} {running}")
+            lines.append(f"{self.name}_sum{_label_text(key)} {total!r}")
+            lines.append(f"{self.name}_count{_label_text(key)} {n}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """Monotonic counter, one value per label set. Thread-safe."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, n: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [{"labels": dict(k), "value": v} for k, v in self._values.items()]
+
+    def _prometheus(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_label_text(k)} {v}" for k, v in values]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+def _register(cls, name: str, *args):
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.get(name)
+            if metric is None:
+                metric = _registry[name] = cls(name, *args)
+    if not isinstance(metric, cls):
+        raise ValueError(f"metric {name!r} is already registered as a {metric.kind}")
+    return metric
+
+
+def histogram(name: str, help: str = "", buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    """The histogram registered under `name`, created on first call."""
+    return _register(Histogram, name, help, buckets)
+
+
+def counter(name: str, help: str = "") -> Counter:
+    """The counter registered under `name`, created on first call."""
+    return _register(Counter, name, help)
+
+
+# -------------------------------------------------------------------
+# Export
+# -------------------------------------------------------------------
+def snapshot() -> dict:
+    """{"histograms": {name: [series]}, "counters": {name: [series]}}, JSON-safe."""
+    out = {"histograms": {}, "counters": {}}
+    for name, metric in sorted(_registry.items()):
+        out["histograms" if metric.kind == "histogram" else "counters"][name] = metric.snapshot()
+    return out
+
+
+def prometheus_text() -> str:
+    """Every registered metric in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        if metric.help:
+            lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        lines.extend(metric._prometheus())
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+    for metric in list(_registry.values()):
+        metric.reset()
+
+
+_server = None
+
+
+def serve_metrics(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """
+    Serve GET /metrics (Prometheus text) and /metrics.json (snapshot()) on a
+    daemon thread. Returns the server, or None if the port is taken (e.g. by
+    another worker process). Port 0 picks a free port.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path == "/metrics":
+                body, ctype = prometheus_text().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/metrics.json":
+                body, ctype = json.dumps(snapshot()).encode("utf-8"), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    try:
+        httpd = ThreadingHTTPServer((host, port), Handler)
+    except OSError:
+        return None
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
+
+
+def start_metrics_server():
+    """Start the METRICS_PORT endpoint once per process (no-op if METRICS_PORT is 0)."""
+    global _server
+    if METRICS_PORT and _server is None:
+        with _registry_lock:
+            if _server is None:
+                _server = serve_metrics(METRICS_PORT, METRICS_HOST)
+    return _server
@@ -2,110 +2,704 @@
 import os
 import json
 import hashlib
+import tempfile
+import warnings
+import threading
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from config import PDF_DIR, VECTOR_DIR, CHUNK_SIZE, CHUNK_OVERLAP, EMBED_DIM, TOP_K
+from metrics import histogram, counter
+from config import (
+    ensure_dirs, PDF_DIR, VECTOR_DIR, CHUNK_SIZE, CHUNK_OVERLAP, EMBED_DIM, EMBED_MODE, EMBED_VOCAB_SIZE,
+    TOP_K, INDEX_WORKERS, RAG_BACKEND, IVF_MIN_VECTORS, IVF_NPROBE,
+    RETRIEVE_BLOCK_MB, EMBED_BATCH,
+)
 
-# Try to import PyMuPDF for real PDF extraction (optional)
-try:
-    import fitz
-    HAS_FITZ = True
-except Exception:
-    HAS_FITZ = False
+# PyMuPDF for real PDF extraction (optional); imported only when a PDF is read
+HAS_FITZ = importlib.util.find_spec("fitz") is not None
 
 INDEX_FILE = os.path.join(VECTOR_DIR, "vectors.npy")
-META_FILE = os.path.join(VECTOR_DIR, "metadata.json")
+META_FILE = os.path.join(VECTOR_DIR, "metadata.json")  # legacy format, removed on rebuild
+CHUNK_TABLE_FILE = os.path.join(VECTOR_DIR, "chunks.npy")
+CHUNK_TEXT_FILE = os.path.join(VECTOR_DIR, "chunks.bin")
+SOURCES_FILE = os.path.join(VECTOR_DIR, "sources.json")
+COPY_ROWS = 65536  # vectors copied per step when merging an index
+GEN_FILE = os.path.join(VECTOR_DIR, "generation")
+MANIFEST_FILE = os.path.join(VECTOR_DIR, "manifest.json")
+
+# word -> 32-bit MD5 prefix, shared by every embedding call in the process
+_VOCAB = {}
+
+def _word_hashes(words) -> list:
+    vocab = _VOCAB
+    out = list(map(vocab.get, words))
+    if None in out:
+        if len(vocab) >= EMBED_VOCAB_SIZE:
+            vocab.clear()
+        for i, h in enumerate(out):
+            if h is None:
+                w = words[i]
+                h = int.from_bytes(hashlib.md5(w.encode("utf-8")).digest()[:4], "big")
+                vocab[w] = out[i] = h
+    return out
+
+def _embed_matrix(texts, dim: int, mode: str) -> np.ndarray:
+    """float64 (len(texts), dim) embedding matrix, rows L2-normalised."""
+    hashes = []
+    lengths = []
+    for t in texts:
+        words = t.lower().split()
+        hashes.extend(_word_hashes(words))
+        lengths.append(len(words))
+    n = len(texts)
+    h = np.array(hashes, dtype=np.int64)
+    lengths = np.array(lengths, dtype=np.int64)
+    weights = (h % 1000) / 1000.0
+    rows = np.repeat(np.arange(n, dtype=np.int64), lengths)
+    if mode == "compat":
+        # Word position picks the bucket, exactly like the original per-word loop
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        cols = (np.arange(len(h), dtype=np.int64) - starts) % dim
+    else:
+        cols = h % dim
+    # bincount accumulates in input order, so sums match the sequential += loop bit for bit
+    mat = np.bincount(rows * dim + cols, weights=weights, minlength=n * dim)
+    mat = mat.astype(np.float64, copy=False).reshape(n, dim)
+    if mode == "compat":
+        norms = np.array([np.linalg.norm(row) for row in mat])
+    else:
+        norms = np.sqrt(np.einsum("ij,ij->i", mat, mat))
+    nz = norms > 0
+    mat[nz] /= norms[nz, None]
+    return mat
+
+def embed_texts(texts, dim: int = EMBED_DIM, mode: str = EMBED_MODE) -> np.ndarray:
+    """
+    Embed many texts at once into a float32 (len(texts), dim) matrix.
+    mode="compat" reproduces local_hash_embedding exactly (position buckets);
+    mode="hashed" buckets each word by its hash instead.
+    """
+    if not texts:
+        return np.zeros((0, dim), dtype="float32")
+    return _embed_matrix(texts, dim, mode).astype("float32")
 
 def local_hash_embedding(text: str, dim: int = EMBED_DIM) -> np.ndarray:
-    vec = np.zeros(dim, dtype=float)
-    words = text.lower().split()
-    for i, w in enumerate(words):
-        h = int(hashlib.md5(w.encode("utf-8")).hexdigest()[:8], 16)
-        vec[i % dim] += (h % 1000) / 1000.0
-    norm = np.linalg.norm(vec)
-    if norm > 0:
-        vec = vec / norm
-    return vec
+    return _embed_matrix([text], dim, EMBED_MODE)[0]
 
-def extract_text_from_pdf(path: str) -> str:
+def iter_pdf_pages(path: str):
+    """Yield the text of a PDF one page at a time."""
     if not HAS_FITZ:
         raise RuntimeError("PyMuPDF (fitz) not installed.")
+    import fitz
     doc = fitz.open(path)
-    pages = []
-    for p in range(doc.page_count):
-        page = doc.load_page(p)
-        pages.append(page.get_text("text"))
-    doc.close()
-    return "\n".join(pages)
+    try:
+        for p in range(doc.page_count):
+            yield doc.load_page(p).get_text("text")
+    finally:
+        doc.close()
 
-def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
-    text = text.replace("\r\n", "\n")
-    if len(text) <= chunk_size:
-        return [text]
-    chunks = []
+def extract_text_from_pdf(path: str) -> str:
+    return "\n".join(iter_pdf_pages(path))
+
+def iter_chunks(pieces, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP, sep: str = "\n"):
+    """
+    Lazily chunk sep.join(pieces), yielding exactly what chunk_text would for
+    the joined string while holding only about one chunk plus one piece.
+    """
+    buf = ""      # normalised text starting at absolute offset `base`
+    base = 0
     start = 0
-    N = len(text)
+    carry = ""    # a trailing "\r" that may pair with the next piece's "\n"
+    long_text = False
+    first = True
+    for piece in pieces:
+        seg = carry + (piece if first else sep + piece)
+        first = False
+        carry = ""
+        if seg.endswith("\r"):
+            carry, seg = "\r", seg[:-1]
+        buf += seg.replace("\r\n", "\n")
+        if not long_text:
+            if len(buf) <= chunk_size:
+                continue
+            long_text = True
+        # Windows ending strictly before the buffered text ends cannot be the last one
+        while start + chunk_size < base + len(buf):
+            end = start + chunk_size
+            chunk = buf[start - base:end - base].strip()
+            if chunk:
+                yield chunk
+            start = max(0, end - overlap)
+            if start > base:
+                buf = buf[start - base:]
+                base = start
+    buf += carry
+    if not long_text and len(buf) <= chunk_size:
+        yield buf
+        return
+    N = base + len(buf)
     while start < N:
         end = min(start + chunk_size, N)
-        chunk = text[start:end].strip()
+        chunk = buf[start - base:end - base].strip()
         if chunk:
-            chunks.append(chunk)
+            yield chunk
         if end == N:
             break
         start = max(0, end - overlap)
-    return chunks
 
-def build_index_from_folder(folder_path: str = PDF_DIR):
-    all_chunks = []
-    metadata = []
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+    return list(iter_chunks([text], chunk_size, overlap))
+
+# -------------------------------------------------------------------
+# Chunk store: offsets table + memory-mapped UTF-8 text blob
+# -------------------------------------------------------------------
+CHUNK_TABLE_DTYPE = np.dtype([
+    ("offset", "<i8"),
+    ("length", "<i8"),
+    ("source", "<i4"),
+    ("chunk_index", "<i4"),
+])
+
+class ChunkStore:
+    """
+    Random access to chunk text and metadata by chunk id.
+    The table and the text blob are memory-mapped, so only the chunks that
+    are actually read get paged in. store[i] returns the metadata dict.
+    """
+
+    def __init__(self, table: np.ndarray, blob, sources: list):
+        self.table = table
+        self.blob = blob
+        self.sources = sources
+
+    @classmethod
+    def open(cls, table_path: str = CHUNK_TABLE_FILE, text_path: str = CHUNK_TEXT_FILE,
+             sources_path: str = SOURCES_FILE):
+        table = np.load(table_path, mmap_mode="r")
+        if table.dtype != CHUNK_TABLE_DTYPE:
+            raise ValueError("unexpected chunk table layout")
+        size = os.path.getsize(text_path)
+        # np.memmap refuses empty files; an all-empty corpus has an empty blob
+        blob = np.memmap(text_path, dtype=np.uint8, mode="r") if size else np.zeros(0, dtype=np.uint8)
+        with open(sources_path, "r", encoding="utf-8") as f:
+            sources = json.load(f)
+        if len(table) and int(table["offset"][-1] + table["length"][-1]) != size:
+            raise ValueError("chunk table does not match text blob")
+        return cls(table, blob, sources)
+
+    def __len__(self):
+        return len(self.table)
+
+    def text(self, i: int) -> str:
+        row = self.table[i]
+        off, n = int(row["offset"]), int(row["length"])
+        return self.blob[off:off + n].tobytes().decode("utf-8")
+
+    def meta(self, i: int, text: str = None) -> dict:
+        row = self.table[i]
+        if text is None:
+            text = self.text(i)
+        return {
+            "source": self.sources[int(row["source"])],
+            "chunk_index": int(row["chunk_index"]),
+            "preview": text[:400].replace("\n", " "),
+        }
+
+    __getitem__ = meta
+
+def _iter_blocks(f, block: int = 1 << 20):
+    for data in iter(lambda: f.read(block), b""):
+        yield data
+
+class _IndexWriter:
+    """
+    Streams a new index into temp files: vectors and the chunk table go into
+    pre-sized .npy memmaps and chunk texts are appended to the blob, so
+    nothing proportional to the corpus is held in memory.
+    """
+
+    def __init__(self, total: int, dim: int = EMBED_DIM):
+        self.vectors = np.lib.format.open_memmap(INDEX_FILE + ".tmp", mode="w+", dtype="float32", shape=(total, dim))
+        self.table = np.lib.format.open_memmap(CHUNK_TABLE_FILE + ".tmp", mode="w+", dtype=CHUNK_TABLE_DTYPE, shape=(total,))
+        self.blob = open(CHUNK_TEXT_FILE + ".tmp", "wb")
+        self.sources = []
+        self.row = 0
+        self.offset = 0
+
+    def add(self, source: str, vectors, lengths, chunk_index, text_blocks):
+        n = len(lengths)
+        r = self.row
+        for i in range(0, n, COPY_ROWS):
+            self.vectors[r + i:r + min(n, i + COPY_ROWS)] = vectors[i:i + COPY_ROWS]
+        rows = self.table[r:r + n]
+        lengths = np.asarray(lengths, dtype=np.int64)
+        rows["offset"] = self.offset + np.cumsum(lengths) - lengths
+        rows["length"] = lengths
+        rows["source"] = len(self.sources)
+        rows["chunk_index"] = chunk_index
+        for data in text_blocks:
+            self.blob.write(data)
+        self.sources.append(source)
+        self.row += n
+        self.offset += int(lengths.sum())
+
+    def close(self):
+        self.vectors.flush()
+        self.table.flush()
+        self.blob.close()
+        del self.vectors, self.table
+        with open(SOURCES_FILE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.sources, f, ensure_ascii=False)
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _build_settings() -> dict:
+    """Settings that change the index contents; any change forces a full rebuild."""
+    return {
+        "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+        "embed_dim": EMBED_DIM, "embed_mode": EMBED_MODE, "store": "chunks-v1",
+    }
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_chunks(chunks, vec_file, txt_file, lengths: list, batch: int = EMBED_BATCH):
+    """Embed chunks batch by batch, appending vectors and UTF-8 text to the open files."""
+    pending = []
+    for chunk in chunks:
+        pending.append(chunk)
+        if len(pending) >= batch:
+            _flush_chunks(pending, vec_file, txt_file, lengths)
+            pending = []
+    if pending:
+        _flush_chunks(pending, vec_file, txt_file, lengths)
+
+def _flush_chunks(chunks, vec_file, txt_file, lengths: list):
+    embed_texts(chunks).tofile(vec_file)
+    for c in chunks:
+        data = c.encode("utf-8")
+        txt_file.write(data)
+        lengths.append(len(data))
+
+def _process_pdf(full: str, seg_prefix: str):
+    """
+    Extract, chunk and embed one PDF page by page, in constant memory.
+    Vectors and chunk texts are written to <seg_prefix>.vec / .txt;
+    returns the UTF-8 byte length of every chunk.
+    """
+    lengths = []
+    with open(seg_prefix + ".vec", "wb") as vf, open(seg_prefix + ".txt", "wb") as tf:
+        try:
+            _write_chunks(iter_chunks(iter_pdf_pages(full)), vf, tf, lengths)
+        except Exception:
+            # An unreadable PDF indexes as a single empty chunk, as before
+            for f in (vf, tf):
+                f.seek(0)
+                f.truncate()
+            lengths = []
+            _write_chunks(chunk_text(""), vf, tf, lengths)
+    return lengths
+
+def _reusable_index(manifest):
+    """Open the current index if the manifest describes it and was built with today's settings."""
+    if not manifest or manifest.get("settings") != _build_settings():
+        return None, None
+    vectors, store = load_index()
+    if vectors is None or len(vectors) != manifest.get("total") or len(store) != len(vectors):
+        return None, None
+    return vectors, store
+
+def _process_pdfs(jobs, workers: int):
+    """Run _process_pdf over (full, seg_prefix) jobs, in parallel if workers > 1. Results keep job order."""
+    if workers <= 1 or len(jobs) <= 1:
+        return [_process_pdf(full, seg) for full, seg in jobs]
+    ctx = multiprocessing.get_context("spawn")  # fork would copy the caller's threads and locks
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=ctx) as pool:
+        return list(pool.map(_process_pdf, *zip(*jobs)))
+
+def build_index_from_folder(folder_path: str = PDF_DIR, incremental: bool = True, workers: int = None):
+    """
+    Build the vector index from every PDF in folder_path.
+    With incremental=True, PDFs whose content hash is unchanged since the last
+    build reuse their stored vectors; only new or changed files are processed
+    and deleted files are dropped. New or changed PDFs are extracted and
+    embedded by a pool of `workers` processes (default INDEX_WORKERS, which
+    is 1: serial) and merged in file-name order, so the output matches a
+    serial build. With workers > 1 the pool is spawned, so a calling script
+    needs an `if __name__ == "__main__":` guard.
+    PDFs are read page by page and embeddings written in EMBED_BATCH-sized
+    batches, so memory use does not grow with document size.
+    Returns the number of indexed chunks.
+    """
+    ensure_dirs()
+    if workers is None:
+        workers = INDEX_WORKERS or os.cpu_count() or 1
+    manifest = _load_manifest() if incremental else None
+    old_vectors, old_store = _reusable_index(manifest)
+    old_files = manifest.get("files", {}) if old_vectors is not None else {}
+
+    # Pass 1: decide per file whether its stored rows can be reused
+    plan = []
+    jobs = []
     for fname in sorted(os.listdir(folder_path)):
         if not fname.lower().endswith(".pdf"):
             continue
         full = os.path.join(folder_path, fname)
-        try:
-            txt = extract_text_from_pdf(full)
-        except Exception:
-            txt = ""
-        chunks = chunk_text(txt)
-        for i, c in enumerate(chunks):
-            all_chunks.append(c)
-            metadata.append({
-                "source": fname,
-                "chunk_index": i,
-                "preview": c[:400].replace("\n"," ")
-            })
-    if not all_chunks:
-        if os.path.exists(INDEX_FILE):
-            os.remove(INDEX_FILE)
-        if os.path.exists(META_FILE):
-            os.remove(META_FILE)
+        st = os.stat(full)
+        prev = old_files.get(fname)
+        if prev and prev.get("size") == st.st_size and prev.get("mtime_ns") == st.st_mtime_ns:
+            digest = prev["sha256"]
+        else:
+            digest = _file_digest(full)
+        entry = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        if prev and prev["sha256"] == digest:
+            plan.append((fname, entry, prev, None))
+        else:
+            plan.append((fname, entry, None, len(jobs)))
+            jobs.append(full)
+
+    changed = bool(jobs) or set(fname for fname, _, _, _ in plan) != set(old_files)
+    with tempfile.TemporaryDirectory(dir=VECTOR_DIR) as seg_dir:
+        # Pass 2: stream new/changed files into per-file segments (in parallel)
+        segs = [os.path.join(seg_dir, str(j)) for j in range(len(jobs))]
+        seg_lengths = _process_pdfs(list(zip(jobs, segs)), workers)
+
+        files = {}
+        total = 0
+        for fname, entry, prev, job in plan:
+            if prev is not None:
+                changed = changed or prev["start"] != total
+                count = prev["count"]
+            else:
+                count = len(seg_lengths[job])
+            entry["start"] = total
+            entry["count"] = count
+            files[fname] = entry
+            total += count
+
+        if not total:
+            for path in (INDEX_FILE, META_FILE, CHUNK_TABLE_FILE, CHUNK_TEXT_FILE, SOURCES_FILE, MANIFEST_FILE):
+                if os.path.exists(path):
+                    os.remove(path)
+            return 0
+        if not changed:
+            return total
+
+        # Pass 3: merge reused rows and fresh segments, in file order, into temp files
+        writer = _IndexWriter(total)
+        for fname, entry, prev, job in plan:
+            if prev is not None:
+                s, n = prev["start"], prev["count"]
+                rows = old_store.table[s:s + n]
+                lo = int(rows["offset"][0]) if n else 0
+                hi = int(rows["offset"][-1] + rows["length"][-1]) if n else 0
+                texts = (old_store.blob[i:min(hi, i + (1 << 20))].tobytes() for i in range(lo, hi, 1 << 20))
+                writer.add(fname, old_vectors[s:s + n], rows["length"], rows["chunk_index"], texts)
+            else:
+                lengths = seg_lengths[job]
+                n = len(lengths)
+                vecs = np.memmap(segs[job] + ".vec", dtype="float32", mode="r", shape=(n, EMBED_DIM)) if n else []
+                with open(segs[job] + ".txt", "rb") as f:
+                    writer.add(fname, vecs, lengths, np.arange(n), _iter_blocks(f))
+                del vecs
+        writer.close()
+
+    manifest = {"settings": _build_settings(), "total": total, "files": files}
+    with open(MANIFEST_FILE + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    # Swap the finished files in so readers never see a half-written index.
+    # The files go in one by one, so the generation is odd while they do:
+    # resident indexes keep the previous set until it is even again.
+    _bump_generation(swapping=True)
+    for path in (CHUNK_TEXT_FILE, SOURCES_FILE, CHUNK_TABLE_FILE, INDEX_FILE, MANIFEST_FILE):
+        os.replace(path + ".tmp", path)
+    if os.path.exists(META_FILE):
+        os.remove(META_FILE)
+    _bump_generation()
+    return total
+
+_RETRIEVE_SECONDS = histogram("mathwiz_retrieve_seconds", "retrieve_many phases: index snapshot, embed, search, format")
+_INDEX_LOADS = counter("mathwiz_index_loads_total", "Vector index (re)loads by the resident handle")
+
+def _read_generation() -> int:
+    try:
+        with open(GEN_FILE, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
         return 0
-    vectors = np.vstack([local_hash_embedding(c) for c in all_chunks]).astype("float32")
-    np.save(INDEX_FILE, vectors)
-    with open(META_FILE, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
-    return len(all_chunks)
+
+def _bump_generation(swapping: bool = False):
+    """
+    Advance the on-disk generation counter so resident indexes reload.
+    It is odd while a build is swapping files in, even once they are all in.
+    """
+    gen = _read_generation() + 1
+    if gen % 2 != swapping:
+        gen += 1
+    with open(GEN_FILE + ".tmp", "w", encoding="utf-8") as f:
+        f.write(str(gen))
+    os.replace(GEN_FILE + ".tmp", GEN_FILE)
+    return gen
+
+def _index_signature():
+    """Cheap fingerprint of the on-disk index (generation + file stats)."""
+    try:
+        vst = os.stat(INDEX_FILE)
+        mst = os.stat(CHUNK_TABLE_FILE)
+    except OSError:
+        return None
+    return (
+        _read_generation(),
+        vst.st_ino, vst.st_mtime_ns, vst.st_size,
+        mst.st_ino, mst.st_mtime_ns, mst.st_size,
+    )
+
+def index_version() -> str:
+    """Opaque string that changes whenever the on-disk index is rebuilt or replaced."""
+    return repr(_index_signature())
+
+# -------------------------------------------------------------------
+# Search backends: search(qvec, top_k) -> (indices, scores), best first
+# -------------------------------------------------------------------
+def _top_k(scores: np.ndarray, top_k: int):
+    """Indices of the top_k highest scores, sorted best first, without a full sort."""
+    n = len(scores)
+    if top_k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if top_k < n:
+        idxs = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        idxs = np.arange(n)
+    return idxs[np.argsort(-scores[idxs], kind="stable")]
+
+def _block_rows(n_vectors: int, block_mb: int = RETRIEVE_BLOCK_MB) -> int:
+    """Queries per block so one float32 score block stays under block_mb."""
+    return max(1, (block_mb << 20) // (4 * max(1, n_vectors)))
+
+# Queries per matrix product. BLAS picks its kernel (and so its rounding) by
+# the shape of the product, so every product has exactly this many rows.
+_KERNEL_ROWS = 16
+
+class ExactSearch:
+    """
+    Brute-force inner product over every vector (vectors are unit length).
+    Queries are scored _KERNEL_ROWS at a time, zero-padded, so a query's
+    scores do not depend on the batch it arrived in.
+    """
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def search(self, qvec: np.ndarray, top_k: int):
+        return self.search_many(qvec.reshape(1, -1), top_k)[0]
+
+    def _scores(self, block: np.ndarray) -> np.ndarray:
+        sims = np.empty((len(block), len(self.vectors)), dtype=np.float32)
+        pad = np.zeros((_KERNEL_ROWS, block.shape[1]), dtype=self.vectors.dtype)
+        for j in range(0, len(block), _KERNEL_ROWS):
+            part = block[j:j + _KERNEL_ROWS]
+            pad[:len(part)] = part
+            pad[len(part):] = 0
+            sims[j:j + len(part)] = (self.vectors @ pad.T).T[:len(part)]
+        return sims
+
+    def search_many(self, qmat: np.ndarray, top_k: int, block_rows: int = None):
+        block_rows = block_rows or _block_rows(len(self.vectors))
+        out = []
+        for i in range(0, len(qmat), block_rows):
+            for row in self._scores(qmat[i:i + block_rows]):
+                idxs = _top_k(row, top_k)
+                out.append((idxs, row[idxs]))
+        return out
+
+class IVFSearch:
+    """
+    Inverted-file approximate search, NumPy only.
+    Vectors are partitioned by spherical k-means into `nlist` lists; a query
+    is scored exactly against the vectors of its `nprobe` closest lists.
+    Raising nprobe trades latency for recall (nprobe == nlist is exact).
+    """
+
+    def __init__(self, vectors: np.ndarray, nlist: int = 0, nprobe: int = IVF_NPROBE,
+                 iters: int = 10, seed: int = 0):
+        self.vectors = vectors
+        n = len(vectors)
+        nlist = nlist or int(np.sqrt(n))
+        self.nlist = max(1, min(nlist, n))
+        self.nprobe = nprobe
+        self.centroids = self._train(iters, seed)
+        assign = np.argmax(self._centroid_scores(vectors), axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+
+    def _centroid_scores(self, vectors, block: int = 65536):
+        return np.vstack([vectors[i:i + block] @ self.centroids.T for i in range(0, len(vectors), block)])
+
+    def _train(self, iters: int, seed: int) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        n = len(self.vectors)
+        sample_size = min(n, self.nlist * 64)
+        sample = np.asarray(self.vectors[np.sort(rng.choice(n, sample_size, replace=False))])
+        centroids = sample[rng.choice(sample_size, self.nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            empty = norms == 0
+            # Re-seed empty lists from random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms[empty] = np.linalg.norm(sums[empty], axis=1)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms[:, None]
+        return centroids.astype("float32")
+
+    def search(self, qvec: np.ndarray, top_k: int):
+        probe = _top_k(self.centroids @ qvec, min(self.nprobe, self.nlist))
+        cand = np.concatenate([self.lists[i] for i in probe])
+        cand.sort()
+        sims = self.vectors[cand] @ qvec
+        best = _top_k(sims, top_k)
+        return cand[best], sims[best]
+
+    def search_many(self, qmat: np.ndarray, top_k: int, block_rows: int = None):
+        return [self.search(q, top_k) for q in qmat]
+
+SEARCH_BACKENDS = {"exact": ExactSearch, "ivf": IVFSearch}
+
+def make_searcher(vectors: np.ndarray, backend: str = RAG_BACKEND):
+    """Build the search backend for `vectors`. "auto" picks IVF once the index is large."""
+    if backend == "auto":
+        backend = "ivf" if len(vectors) >= IVF_MIN_VECTORS else "exact"
+    return SEARCH_BACKENDS[backend](vectors)
+
+class _ResidentIndex:
+    """
+    Process-wide handle on the vector index.
+    Loads once (vectors memory-mapped), serves every query from memory and
+    reloads only when the files on disk change. Safe to share across threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (signature, vectors, chunk store, searcher) swapped as one tuple so readers never mix generations
+        self._state = (None, None, None, None)
+        self._legacy_checked = False
+
+    def snapshot(self):
+        sig = _index_signature()
+        state = self._state
+        if sig == state[0]:
+            if sig is None and not self._legacy_checked:
+                self._legacy_checked = True
+                _warn_legacy_index()
+            return state
+        if sig is not None and sig[0] % 2 and state[0] is not None:
+            # A build is swapping files in (or died doing so): keep the
+            # previous index, without taking the lock on every query
+            return state
+        with self._lock:
+            state = self._state
+            if sig != state[0]:
+                state = self._load(sig, state)
+                self._state = state
+        return state
+
+    def get(self):
+        state = self.snapshot()
+        return state[1], state[2]
+
+    def _load(self, sig, previous):
+        if sig is None:
+            return (None, None, None, None)
+        if sig[0] % 2 and previous[0] is not None:
+            return previous  # another thread loaded an index while we waited; keep it through the swap
+        try:
+            vectors = np.load(INDEX_FILE, mmap_mode="r")
+            store = ChunkStore.open()
+        except (OSError, ValueError):
+            # Caught the files mid-swap; keep serving the previous index
+            return previous
+        if len(vectors) != len(store) or _index_signature() != sig:
+            # Mixed generations, or a build started while we were opening
+            return previous
+        _INDEX_LOADS.inc()
+        return (sig, vectors, store, make_searcher(vectors))
+
+    def clear(self):
+        with self._lock:
+            self._state = (None, None, None, None)
+
+_INDEX = _ResidentIndex()
+
+def get_index():
+    """Return (vectors, chunk store) from the resident index, reloading if the files changed."""
+    return _INDEX.get()
+
+def _warn_legacy_index():
+    """Warn if VECTOR_DIR only holds an index in the old vectors.npy + metadata.json format."""
+    if os.path.exists(INDEX_FILE) and os.path.exists(META_FILE) and not os.path.exists(CHUNK_TABLE_FILE):
+        warnings.warn(
+            f"The vector index in {VECTOR_DIR} uses the old vectors.npy + metadata.json format and is "
+            "not loaded, so RAG answers nothing until it is rebuilt: run build_index_from_folder().",
+            RuntimeWarning, stacklevel=3,
+        )
 
 def load_index():
-    if not os.path.exists(INDEX_FILE) or not os.path.exists(META_FILE):
+    """Open the on-disk index directly, bypassing the resident handle. Returns (vectors, ChunkStore)."""
+    if not os.path.exists(INDEX_FILE) or not os.path.exists(CHUNK_TABLE_FILE):
+        _warn_legacy_index()
+        return None, None
+    try:
+        vectors = np.load(INDEX_FILE, mmap_mode="r")
+        store = ChunkStore.open()
+    except (OSError, ValueError):
         return None, None
-    vectors = np.load(INDEX_FILE)
-    with open(META_FILE, "r", encoding="utf-8") as f:
-        metadata = json.load(f)
-    return vectors, metadata
+    return vectors, store
 
-def retrieve(query: str, top_k: int = TOP_K):
-    vectors, metadata = load_index()
-    if vectors is None:
-        return []
-    qvec = local_hash_embedding(query).reshape(1, -1).astype("float32")
-    sims = cosine_similarity(qvec, vectors)[0]
-    idxs = np.argsort(-sims)[:top_k]
+def _format_hits(store, idxs, scores):
     results = []
-    for idx in idxs:
+    for idx, score in zip(idxs, scores):
+        text = store.text(idx)
         results.append({
-            "score": float(sims[idx]),
-            "text": metadata[idx].get("preview", "") + "\n\n(full chunk omitted)",
-            "meta": metadata[idx]
+            "score": float(score),
+            "text": text,
+            "meta": store.meta(idx, text)
         })
     return results
+
+def retrieve_many(queries, top_k: int = TOP_K, block_rows: int = None):
+    """
+    Retrieve the top_k chunks for every query in one pass.
+    Queries are embedded into one matrix and scored block by block
+    (block_rows queries at a time, default sized by RETRIEVE_BLOCK_MB).
+    Returns one result list per query, identical to calling retrieve() on
+    each for any block_rows: scores come from fixed-shape products.
+    """
+    queries = list(queries)
+    with _RETRIEVE_SECONDS.time(phase="index"):
+        _, vectors, store, searcher = _INDEX.snapshot()
+    if vectors is None:
+        return [[] for _ in queries]
+    if not queries:
+        return []
+    with _RETRIEVE_SECONDS.time(phase="embed"):
+        qmat = embed_texts(queries)
+    with _RETRIEVE_SECONDS.time(phase="search"):
+        hits = searcher.search_many(qmat, top_k, block_rows=block_rows)
+    with _RETRIEVE_SECONDS.time(phase="format"):
+        return [_format_hits(store, idxs, scores) for idxs, scores in hits]
+
+def retrieve(query: str, top_k: int = TOP_K):
+    return retrieve_many([query], top_k=top_k)[0]
@@ -0,0 +1,20 @@
+# tests/test_answer_cache.py
+"""Answer cache keys. Run with: python -m pytest tests"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_CACHE_DB", "")
+
+from answer_cache import answer_key, normalize_question
+
+
+def test_whitespace_is_collapsed():
+    assert normalize_question("  solve   2x = 4\n") == "solve 2x = 4"
+
+
+def test_superscripts_and_case_stay_distinct():
+    assert answer_key("x² = 4", "Algebra") != answer_key("x2 = 4", "Algebra")
+    assert answer_key("½ + ½", "Arithmetic") != answer_key("1/2 + 1/2", "Arithmetic")
+    assert answer_key("X + 1", "Algebra") != answer_key("x + 1", "Algebra")
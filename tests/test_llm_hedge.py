@@ -0,0 +1,120 @@
+# tests/test_llm_hedge.py
+"""
+Hedged provider racing (llm_clients._hedged) against local stub providers
+with controlled delays. Run with: python -m pytest tests
+"""
+
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_CACHE_DB", "")
+
+import pytest
+
+import llm_clients
+from llm_stub_server import StubLLMServer
+
+
+def _provider(name, srv):
+    """A (name, fn) provider whose calls are counted under `name` in provider_stats()."""
+    return (name, lambda p, cancel=None: llm_clients.call_generic_http(
+        p, base_url=f"{srv.base_url}/generate", api_key="test", provider=name, cancel=cancel))
+
+
+def _wait_for(predicate, timeout: float = 3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    llm_clients.reset_provider_stats()
+    yield
+    llm_clients.reset_provider_stats()
+
+
+def _stats(name: str) -> dict:
+    return llm_clients.provider_stats().get(name, {})
+
+
+def test_backup_wins_when_primary_is_slow_and_primary_is_cancelled():
+    with StubLLMServer(delay=1.0) as slow, StubLLMServer(delay=0.02) as fast:
+        providers = [_provider("primary", slow), _provider("backup", fast)]
+        t0 = time.perf_counter()
+        res = llm_clients._hedged("q", providers, delay=0.1)
+        elapsed = time.perf_counter() - t0
+
+        assert res["success"] and res["provider"] == "backup"
+        assert 0.1 <= elapsed < 0.5
+        assert _stats("backup")["wins"] == 1
+        # The primary's in-flight request completes later and is thrown away
+        assert _wait_for(lambda: _stats("primary").get("cancelled") == 1)
+        assert _stats("primary")["wins"] == 0
+
+
+def test_fast_primary_never_launches_backup():
+    with StubLLMServer(delay=0.02) as fast, StubLLMServer(delay=0.02) as backup:
+        providers = [_provider("primary", fast), _provider("backup", backup)]
+        res = llm_clients._hedged("q", providers, delay=0.5)
+
+        assert res["provider"] == "primary"
+        assert _stats("primary")["wins"] == 1
+        assert backup.counts["requests"] == 0
+
+
+def test_zero_delay_races_all_providers_at_once():
+    with StubLLMServer(delay=0.3) as slow, StubLLMServer(delay=0.02) as fast:
+        providers = [_provider("primary", slow), _provider("backup", fast)]
+        t0 = time.perf_counter()
+        res = llm_clients._hedged("q", providers, delay=0)
+        elapsed = time.perf_counter() - t0
+
+        assert res["provider"] == "backup"
+        assert elapsed < 0.25
+        assert slow.counts["requests"] == 1 and fast.counts["requests"] == 1
+        assert _wait_for(lambda: _stats("primary").get("cancelled") == 1)
+
+
+def test_failed_primary_launches_backup_without_waiting_out_the_delay():
+    with StubLLMServer(fail_first=100, status=400) as broken, StubLLMServer(delay=0.02) as fast:
+        providers = [_provider("primary", broken), _provider("backup", fast)]
+        t0 = time.perf_counter()
+        res = llm_clients._hedged("q", providers, delay=2.0)
+
+        assert res["provider"] == "backup"
+        assert time.perf_counter() - t0 < 1.0
+        assert _stats("primary")["errors"] == 1
+
+
+def test_all_providers_failing_returns_none():
+    with StubLLMServer(fail_first=100, status=400) as a, StubLLMServer(fail_first=100, status=400) as b:
+        assert llm_clients._hedged("q", [_provider("a", a), _provider("b", b)], delay=0.05) is None
+
+
+def test_concurrent_calls_do_not_wait_on_each_others_losers():
+    # Every call's primary is slow; with shared threads the losers would
+    # hold them and later calls would wait for the primary anyway.
+    with StubLLMServer(delay=1.0) as slow, StubLLMServer(delay=0.02) as fast:
+        providers = [_provider("primary", slow), _provider("backup", fast)]
+        barrier = threading.Barrier(12)
+
+        def one(i):
+            barrier.wait()
+            t0 = time.perf_counter()
+            res = llm_clients._hedged(f"q{i}", providers, delay=0.1)
+            return res["provider"], time.perf_counter() - t0
+
+        with ThreadPoolExecutor(12) as pool:
+            results = list(pool.map(one, range(12)))
+
+        assert all(provider == "backup" for provider, _ in results)
+        assert max(t for _, t in results) < 0.6
+        assert _stats("backup")["wins"] == 12
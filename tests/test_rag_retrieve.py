@@ -0,0 +1,51 @@
+# tests/test_rag_retrieve.py
+"""Batch retrieval must match per-query retrieval exactly. Run with: python -m pytest tests"""
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+import rag_engine
+
+
+class _Store:
+    def text(self, idx):
+        return f"chunk {int(idx)}"
+
+    def meta(self, idx, text):
+        return {"chunk_index": int(idx)}
+
+
+def _texts(rng, vocab, n):
+    return [" ".join(rng.choice(vocab) for _ in range(rng.randint(3, 40))) for _ in range(n)]
+
+
+# BLAS switches kernels with the matrix size, so cover a small and a larger index
+@pytest.fixture(params=[350, 6000])
+def index(monkeypatch, request):
+    rng = random.Random(0)
+    vocab = [f"w{i}" for i in range(3000)]
+    vectors = rag_engine.embed_texts(_texts(rng, vocab, request.param))
+    state = (("test",), vectors, _Store(), rag_engine.ExactSearch(vectors))
+    monkeypatch.setattr(rag_engine._INDEX, "snapshot", lambda: state)
+    return _texts(rng, vocab, 302)
+
+
+@pytest.mark.parametrize("block_rows", [None, 1, 7, 16, 1000])
+def test_retrieve_many_matches_retrieve(index, block_rows):
+    single = [rag_engine.retrieve(q, top_k=5) for q in index]
+    assert rag_engine.retrieve_many(index, top_k=5, block_rows=block_rows) == single
+
+
+def test_scores_do_not_depend_on_batch_position(index):
+    searcher = rag_engine._INDEX.snapshot()[3]
+    qmat = rag_engine.embed_texts(index)
+    full = searcher.search_many(qmat, 10)
+    shifted = searcher.search_many(qmat[3:], 10, block_rows=5)
+    for (i1, s1), (i2, s2) in zip(full[3:], shifted):
+        assert np.array_equal(i1, i2) and np.array_equal(s1, s2)
@@ -0,0 +1,96 @@
+# thought_trace.py
+"""
+Per-question chain-of-thought trace. Each question gets its own Trace in a
+contextvar, so concurrent sessions and tasks never see each other's steps.
+A Trace is a fixed-size ring buffer holding references to the logged
+payloads; nothing is serialized until export(), which caps each payload at
+TRACE_MAX_PAYLOAD characters.
+"""
+
+import json
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from config import TRACE_CAPACITY, TRACE_MAX_PAYLOAD
+
+
+class Trace:
+    """Bounded, append-only record of (step, data) pairs; the oldest steps drop off first."""
+
+    def __init__(self, capacity: int = TRACE_CAPACITY, max_payload: int = TRACE_MAX_PAYLOAD):
+        self.max_payload = max_payload
+        self.convo_id = None  # set once the question is logged, for the task_logs export
+        self.started = time.perf_counter()
+        self.total = 0
+        self._steps = deque(maxlen=capacity)  # deque.append is atomic, so threads may log concurrently
+
+    def add(self, step: str, data):
+        self._steps.append((step, data, time.perf_counter() - self.started))
+        self.total += 1
+
+    @property
+    def dropped(self) -> int:
+        return max(0, self.total - len(self._steps))
+
+    def _payload(self, data):
+        raw = json.dumps(data, default=str)
+        if len(raw) > self.max_payload:
+            return raw[:self.max_payload] + f"... [{len(raw) - self.max_payload} chars truncated]"
+        return json.loads(raw)
+
+    def export(self, steps: list = None) -> list:
+        """Steps as JSON-safe dicts ({"step", "data", "t"}), oldest first, payloads capped."""
+        steps = list(self._steps) if steps is None else steps
+        return [{"step": step, "data": self._payload(data), "t": round(t, 6)} for step, data, t in steps]
+
+    def deferred_export(self):
+        """
+        Snapshot the steps now (a list copy of references) and return a
+        callable that serializes them later, e.g. on the DB writer thread.
+        """
+        steps, dropped = list(self._steps), self.dropped
+        return lambda: {"steps": self.export(steps), "dropped": dropped}
+
+    def clear(self):
+        self._steps.clear()
+        self.total = 0
+
+    def __len__(self):
+        return len(self._steps)
+
+
+_current = ContextVar("thought_trace", default=None)
+
+
+def begin_trace() -> Trace:
+    """Start a fresh trace for the current context (thread, task or copied context)."""
+    trace = Trace()
+    _current.set(trace)
+    return trace
+
+
+def use_trace(trace: Trace):
+    _current.set(trace)
+
+
+def current_trace() -> Trace:
+    """The active trace, starting one if this context has none yet."""
+    trace = _current.get()
+    if trace is None:
+        trace = begin_trace()
+    return trace
+
+
+def log_thought(step: str, data):
+    """Record an internal reasoning step on the current question's trace (never sent to the user)."""
+    current_trace().add(step, data)
+
+
+def get_chain_of_thought(clear: bool = True) -> list:
+    """Exported steps of the current trace. Optionally clears it."""
+    trace = current_trace()
+    steps = trace.export()
+    if clear:
+        trace.clear()
+    return steps
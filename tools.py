@@ -1,26 +1,14 @@
 # tools.py
-from crewai.tools import tool
-from rag_engine import retrieve
+# Heavy modules (numpy via rag_engine, SymPy via calculator's solver) load on
+# first use; the CrewAI wrappers live in crew_tools.py.
 from calculator import solve_math_expression
-from llm_clients import generate
-import json
+from llm_clients import generate, agenerate, generate_stream
 
 # -------------------------------------------------------------------
 # INTERNAL CHAIN OF THOUGHT LOGGER (never sent to user)
+# Per-question, bounded traces; see thought_trace.py
 # -------------------------------------------------------------------
-CHAIN_OF_THOUGHT_LOG = []
-
-def log_thought(step: str, data: dict):
-    """Log internal reasoning steps for debugging purposes."""
-    CHAIN_OF_THOUGHT_LOG.append({"step": step, "data": data})
-
-def get_chain_of_thought(clear: bool = True):
-    """Return internal chain of thought log. Optionally clears it."""
-    global CHAIN_OF_THOUGHT_LOG
-    log_copy = CHAIN_OF_THOUGHT_LOG.copy()
-    if clear:
-        CHAIN_OF_THOUGHT_LOG.clear()
-    return log_copy
+from thought_trace import log_thought, get_chain_of_thought
 
 # -------------------------------------------------------------------
 # 1) PRIMARY GENERAL MATH SOLVER (internal Python function)
@@ -35,27 +23,22 @@ def general_math_solver(question: str) -> dict:
     except Exception as e:
         return {"success": False, "result": None, "confidence": 0.0, "error": str(e)}
 
-# CrewAI Tool wrapper
-@tool("General Math Solver Tool")
-def general_math_solver_tool(question: str) -> str:
-    """CrewAI tool: solves a general math question and returns JSON string."""
-    res = general_math_solver(question)
-    return json.dumps(res)
-
 # -------------------------------------------------------------------
 # 2) RAG PDF SOLVER
 # -------------------------------------------------------------------
 def rag_solver(question: str, top_k: int = 4) -> dict:
     """Internal function to query PDF knowledge base."""
+    from rag_engine import retrieve
     results = retrieve(question, top_k=top_k)
     log_thought("rag", {"question": question, "results_count": len(results)})
     return {"success": True, "chunks": results}
 
-@tool("RAG PDF Math Solver")
-def rag_tool_query(question: str, top_k: int = 4) -> str:
-    """CrewAI tool: retrieves relevant PDF chunks for the question."""
-    res = rag_solver(question, top_k=top_k)
-    return json.dumps(res)
+def rag_solver_many(questions: list, top_k: int = 4) -> list:
+    """Batch version of rag_solver: one embedding + scoring pass for all questions."""
+    from rag_engine import retrieve_many
+    all_results = retrieve_many(questions, top_k=top_k)
+    log_thought("rag_batch", {"questions": len(all_results), "results_count": sum(len(r) for r in all_results)})
+    return [{"success": True, "chunks": results} for results in all_results]
 
 # -------------------------------------------------------------------
 # 3) LLM FALLBACK
@@ -66,11 +49,17 @@ def llm_fallback(question: str) -> dict:
     log_thought("fallback_llm", {"question": question, "answer": answer})
     return {"success": True, "answer": answer}
 
-@tool("LLM Fallback Reasoner")
-def llm_fallback_tool(question: str) -> str:
-    """CrewAI tool: generates an answer using LLM fallback."""
-    res = llm_fallback(question)
-    return json.dumps(res)
+def llm_fallback_stream(question: str):
+    """Streaming llm_fallback: yields text pieces, returns the same dict as llm_fallback."""
+    answer = yield from generate_stream(f"Solve the following math problem: {question}")
+    log_thought("fallback_llm", {"question": question, "answer": answer, "ttft": answer.get("ttft")})
+    return {"success": True, "answer": answer}
+
+async def llm_fallback_async(question: str) -> dict:
+    """Non-blocking llm_fallback for the async pipeline."""
+    answer = await agenerate(f"Solve the following math problem: {question}")
+    log_thought("fallback_llm", {"question": question, "answer": answer})
+    return {"success": True, "answer": answer}
 
 # -------------------------------------------------------------------
 # 4) LLM lightweight wrapper
@@ -81,3 +70,14 @@ def llm_text(prompt: str) -> str:
     if res.get("success"):
         return res.get("text", "")
     return f"[LLM Error] {res.get('error')}"
+
+# -------------------------------------------------------------------
+# CrewAI wrappers moved to crew_tools.py; old imports still resolve
+# -------------------------------------------------------------------
+_CREW_TOOLS = ("general_math_solver_tool", "rag_tool_query", "llm_fallback_tool")
+
+def __getattr__(name):
+    if name in _CREW_TOOLS:
+        import crew_tools
+        return getattr(crew_tools, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")